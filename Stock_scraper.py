@@ -1,19 +1,525 @@
 import requests
 import sqlite3
+import csv
+import os
+import gzip
+import json
+import hashlib
+import tempfile
 import time
+import random
+import threading
+import argparse
 import pandas as pd
 from bs4 import BeautifulSoup
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import logging
 import yfinance as yf
 
+from instrumentation import LatencyRecorder, profile_call
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class TokenBucket:
+    """Thread-safe token bucket shared by all scraper workers"""
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)  # tokens added per second
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available, then consume them"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+# Columns written by the scraper, in INSERT order
+STOCK_COLUMNS = [
+    'symbol', 'name', 'sector', 'industry', 'market_cap', 'pe_ratio', 'pb_ratio',
+    'roe', 'debt_to_equity', 'current_ratio', 'revenue_growth',
+    'net_profit_margin', 'dividend_yield', 'price', 'volume'
+]
+
+UPSERT_STOCK_SQL = f"""
+    INSERT OR REPLACE INTO stocks ({', '.join(STOCK_COLUMNS)})
+    VALUES ({', '.join('?' * len(STOCK_COLUMNS))})
+"""
+
+# Numeric fields kept in the append-only stock_history table
+HISTORY_COLUMNS = [col for col in STOCK_COLUMNS if col not in ('symbol', 'name', 'sector', 'industry')]
+
+def to_date_key(value=None):
+    """Encode a date as an integer YYYYMMDD key (defaults to today, UTC)"""
+    if value is None:
+        return int(time.strftime('%Y%m%d', time.gmtime()))
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], '%Y-%m-%d')
+    return int(value.strftime('%Y%m%d'))
+
+def append_history(conn, rows, snapshot_date=None):
+    """Append dated snapshots for rows (tuples in STOCK_COLUMNS order)
+
+    A snapshot is skipped when it is identical to the symbol's latest one, so
+    the table only grows when something actually changed. Re-running on the
+    same day overwrites that day's snapshot. Caller owns the transaction.
+    """
+    date_key = to_date_key(snapshot_date)
+    metric_idx = [STOCK_COLUMNS.index(col) for col in HISTORY_COLUMNS]
+    latest_sql = f"""
+        SELECT snapshot_date, {', '.join(HISTORY_COLUMNS)} FROM stock_history
+        WHERE symbol = ? AND snapshot_date <= ?
+        ORDER BY snapshot_date DESC LIMIT 1
+    """
+    inserts = []
+    for row in rows:
+        symbol = row[0]
+        metrics = tuple(row[i] for i in metric_idx)
+        latest = conn.execute(latest_sql, (symbol, date_key)).fetchone()
+        if latest and tuple(latest[1:]) == metrics:
+            continue
+        inserts.append((symbol, date_key) + metrics)
+
+    if inserts:
+        updates = ', '.join(f"{col} = excluded.{col}" for col in HISTORY_COLUMNS)
+        conn.executemany(f"""
+            INSERT INTO stock_history (symbol, snapshot_date, {', '.join(HISTORY_COLUMNS)})
+            VALUES ({', '.join('?' * (len(HISTORY_COLUMNS) + 2))})
+            ON CONFLICT(symbol, snapshot_date) DO UPDATE SET {updates}
+        """, inserts)
+    return len(inserts)
+
+# Indexes managed by setup_database. Screens sort on one column and break ties
+# on id, which every index carries implicitly, so each screen is an ordered
+# index walk with no sort step. The last two are covering indexes for the
+# sector summary and the staleness scan.
+STOCK_INDEXES = {
+    'idx_stocks_pe_ratio': 'stocks(pe_ratio)',
+    'idx_stocks_revenue_growth': 'stocks(revenue_growth)',
+    'idx_stocks_dividend_yield': 'stocks(dividend_yield)',
+    'idx_stocks_debt_to_equity': 'stocks(debt_to_equity)',
+    'idx_stocks_market_cap': 'stocks(market_cap)',
+    'idx_stocks_roe': 'stocks(roe)',
+    'idx_stocks_sector': 'stocks(sector)',
+    'idx_stocks_freshness': 'stocks(symbol, market_cap, last_updated)',
+    # Score screens walk these, globally or within one sector; stock_id rides
+    # along as the rowid, so the id tie-break needs no sort either
+    'idx_scores_symbol': 'stock_scores(symbol)',
+    'idx_scores_value': 'stock_scores(value_score)',
+    'idx_scores_growth': 'stock_scores(growth_score)',
+    'idx_scores_quality': 'stock_scores(quality_score)',
+    'idx_scores_composite': 'stock_scores(composite_score)',
+    'idx_scores_sector_value': 'stock_scores(sector, value_score)',
+    'idx_scores_sector_growth': 'stock_scores(sector, growth_score)',
+    'idx_scores_sector_quality': 'stock_scores(sector, quality_score)',
+    'idx_scores_sector_composite': 'stock_scores(sector, composite_score)',
+}
+
+def ensure_indexes(conn):
+    """Create any missing managed indexes; safe to run on existing databases"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = []
+    for name, target in STOCK_INDEXES.items():
+        if name not in existing:
+            conn.execute(f"CREATE INDEX {name} ON {target}")
+            created.append(name)
+    if created:
+        # Refresh planner statistics so the new indexes are costed correctly
+        conn.execute("ANALYZE")
+        logger.info(f"Created indexes: {', '.join(created)}")
+    return created
+
+# Sector-relative percentile ranks kept in stock_scores: (rank column, stocks
+# column, whether higher is better, whether only positive values are ranked).
+# Every rank is 0-100 with 100 the best in its sector.
+RANK_METRICS = [
+    ('pe_rank', 'pe_ratio', False, True),  # negative PE means losses, not cheapness
+    ('pb_rank', 'pb_ratio', False, True),
+    ('roe_rank', 'roe', True, False),
+    ('margin_rank', 'net_profit_margin', True, False),
+    ('growth_rank', 'revenue_growth', True, False),
+    ('debt_rank', 'debt_to_equity', False, False),
+]
+
+# Composite scores: the mean of whichever component ranks are available
+SCORE_COMPONENTS = {
+    'value_score': ['pe_rank', 'pb_rank'],
+    'growth_score': ['growth_rank', 'margin_rank'],
+    'quality_score': ['roe_rank', 'margin_rank', 'debt_rank'],
+}
+SCORE_COLUMNS = list(SCORE_COMPONENTS) + ['composite_score']
+
+def _mean_of_present(columns):
+    total = ' + '.join(f"COALESCE({col}, 0)" for col in columns)
+    present = ' + '.join(f"({col} IS NOT NULL)" for col in columns)
+    return f"({total}) / NULLIF({present}, 0)"
+
+def _rank_window(column, higher_is_better, positive_only):
+    valid = f"{column} IS NOT NULL" + (f" AND {column} > 0" if positive_only else "")
+    return valid, f"PARTITION BY sector, ({valid}) ORDER BY {column} {'ASC' if higher_is_better else 'DESC'}"
+
+def _rank_expression(rank, column, higher_is_better, positive_only):
+    valid, _ = _rank_window(column, higher_is_better, positive_only)
+    # Both functions share the named window's sort. PERCENT_RANK 0 with CUME_DIST 1
+    # means everyone ties (or the company is alone in its sector): neither best nor worst.
+    # A non-positive value of a positive-only metric ranks last rather than unranked
+    return (f"CASE WHEN {column} IS NULL THEN NULL WHEN NOT ({valid}) THEN 0.0 "
+            f"WHEN PERCENT_RANK() OVER w_{rank} = 0 AND CUME_DIST() OVER w_{rank} = 1 THEN 50.0 "
+            f"ELSE 100.0 * PERCENT_RANK() OVER w_{rank} END AS {rank}")
+
+def touched_sectors(conn, rows):
+    """Sectors whose ranks change when rows are written: their new sectors and, for
+    symbols that moved, the sectors stock_scores still has them in"""
+    symbols = [row[0] for row in rows]
+    sectors = {row[STOCK_COLUMNS.index('sector')] for row in rows}
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i + 500]
+        sectors.update(r[0] for r in conn.execute(
+            f"SELECT DISTINCT sector FROM stock_scores WHERE symbol IN ({', '.join('?' * len(chunk))})", chunk))
+    return {sector for sector in sectors if sector}
+
+def refresh_scores(conn, rows=None, sectors=None):
+    """Recompute stock_scores for the sectors touched by rows (all sectors if neither given)
+
+    Ranks only depend on a company's own sector, so a batch touching two
+    sectors recomputes those two. A symbol that moved sector also refreshes
+    its old one. `sectors` names them directly instead. Caller owns the
+    transaction. Returns the sectors recomputed.
+    """
+    if rows is not None:
+        sectors = touched_sectors(conn, rows) | set(sectors or ())
+    if sectors is not None:
+        sectors = sorted(sectors)
+        if not sectors:
+            return []
+
+    where = "sector IS NOT NULL AND sector != ''"
+    params = []
+    if sectors is None:
+        conn.execute("DELETE FROM stock_scores")
+    else:
+        placeholders = ', '.join('?' * len(sectors))
+        conn.execute(f"DELETE FROM stock_scores WHERE sector IN ({placeholders})", sectors)
+        where += f" AND sector IN ({placeholders})"
+        params = sectors
+
+    ranks = [rank for rank, _, _, _ in RANK_METRICS]
+    scores = [f"{_mean_of_present(parts)} AS {name}" for name, parts in SCORE_COMPONENTS.items()]
+    conn.execute(f'''
+        INSERT INTO stock_scores (stock_id, symbol, sector, {', '.join(ranks)}, {', '.join(SCORE_COLUMNS)})
+        SELECT stock_id, symbol, sector, {', '.join(ranks)}, {', '.join(SCORE_COMPONENTS)},
+               {_mean_of_present(list(SCORE_COMPONENTS))} AS composite_score
+        FROM (
+            SELECT *, {', '.join(scores)}
+            FROM (
+                SELECT id AS stock_id, symbol, sector,
+                       {', '.join(_rank_expression(*metric) for metric in RANK_METRICS)}
+                FROM stocks WHERE {where}
+                WINDOW {', '.join(f"w_{rank} AS ({_rank_window(*rest)[1]})" for rank, *rest in RANK_METRICS)}
+            )
+        )
+    ''', params)
+    if sectors is None:
+        sectors = [r[0] for r in conn.execute("SELECT DISTINCT sector FROM stock_scores ORDER BY sector")]
+    return sectors
+
+# Market-cap tiers (INR) and how long a row in each tier stays fresh, in seconds.
+# Large caps are the most screened, so they are refreshed most often.
+MARKET_CAP_TIERS = [('large', 1e12), ('mid', 2e11), ('small', 0)]
+DEFAULT_TIER_TTLS = {'large': 6 * 3600, 'mid': 12 * 3600, 'small': 24 * 3600}
+
+def market_cap_tier(market_cap):
+    """Map a market cap to its tier name"""
+    for tier, floor in MARKET_CAP_TIERS:
+        if market_cap is not None and market_cap >= floor:
+            return tier
+    return 'small'
+
+# Exchange listing files understood by read_symbol_listing, keyed by the header
+# column that identifies them: NSE's EQUITY_L.csv, BSE's scrip list, or a plain
+# file with a `symbol` column (already carrying its .NS / .BO suffix)
+def _nse_listing(row):
+    return row['SYMBOL'] + '.NS', row.get('NAME OF COMPANY'), 'NSE', row.get('ISIN NUMBER'), True
+
+def _bse_listing(row):
+    active = row.get('Status', 'Active').lower() == 'active'
+    return row['Security Id'] + '.BO', row.get('Security Name'), 'BSE', row.get('ISIN No'), active
+
+def _plain_listing(row):
+    symbol = row['symbol'].upper()
+    exchange = row.get('exchange') or ('BSE' if symbol.endswith('.BO') else 'NSE')
+    active = row.get('active', '1').lower() not in ('0', 'false', 'no')
+    return symbol, row.get('name'), exchange, row.get('isin'), active
+
+LISTING_FORMATS = [('SYMBOL', _nse_listing), ('Security Id', _bse_listing), ('symbol', _plain_listing)]
+
+# A company listed on both exchanges is scraped once, from the first exchange
+# here (NSE quotes are the more liquid and better covered by yfinance)
+EXCHANGE_PREFERENCE = ['NSE', 'BSE']
+
+def read_symbol_listing(path):
+    """Yield (symbol, name, exchange, isin, active) tuples from a listing CSV"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [col.strip() for col in next(reader)]
+        parse = next((fn for key, fn in LISTING_FORMATS if key in header), None)
+        if parse is None:
+            raise ValueError(f"Unrecognised listing format in {path}: {header}")
+        for values in reader:
+            row = {col: value.strip() for col, value in zip(header, values)}
+            if row.get('SERIES', 'EQ') not in ('EQ', 'BE'):
+                continue  # NSE lists non-equity series in the same file
+            if any(row.values()):
+                yield parse(row)
+
+def latest_quotes(frame, symbols):
+    """Last non-null (close, volume) per symbol from a yf.download frame"""
+    quotes = {}
+    grouped = isinstance(frame.columns, pd.MultiIndex)
+    for symbol in symbols:
+        # group_by='ticker' gives (ticker, field) columns; a single ticker may come back flat
+        if grouped:
+            if symbol not in frame.columns.get_level_values(0):
+                continue
+            data = frame[symbol]
+        elif len(symbols) == 1:
+            data = frame
+        else:
+            continue
+        if 'Close' not in data:
+            continue
+        closes = data['Close'].dropna()
+        volumes = data['Volume'].dropna() if 'Volume' in data else None
+        if closes.empty:
+            continue  # no trades in the window, or an unknown ticker
+        volume = int(volumes.iloc[-1]) if volumes is not None and not volumes.empty else None
+        quotes[symbol] = (float(closes.iloc[-1]), volume)
+    return quotes
+
+# Scrapes of at least this many symbols rank sectors once at the end instead of
+# after every batch; with random sectors each batch touches nearly all of them
+SCORE_DEFER_ROWS = 1000
+
+class BulkStockWriter:
+    """Buffered writer that batches stock rows into one long-lived WAL connection
+
+    Sector scores are refreshed after every batch, which keeps them current
+    during small incremental writes. With `defer_scores` the touched sectors
+    are collected instead and ranked once in close(), so bulk loads stay
+    linear rather than re-ranking whole sectors per batch.
+    """
+    def __init__(self, db_path, batch_size=100, record_history=True, metrics=None, record_scores=True,
+                 defer_scores=False):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.record_history = record_history
+        self.record_scores = record_scores
+        self.defer_scores = defer_scores
+        self.pending_sectors = set()
+        self.metrics = metrics or LatencyRecorder()
+        self.buffer = []
+        self.rows_written = 0
+        self.rows_failed = 0  # rows in batches whose transaction failed and was rolled back
+        self.flushes = 0
+        self.write_seconds = 0.0
+
+        self.conn = sqlite3.connect(db_path)
+        # WAL lets the screener keep reading while we write; NORMAL sync is
+        # durable at checkpoint and skips the fsync on every commit
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-16000")  # ~16MB page cache
+        self.conn.execute("PRAGMA busy_timeout=5000")
+
+    def add(self, stock_data):
+        """Queue one row, flushing when the buffer reaches batch_size"""
+        self.buffer.append(tuple(stock_data.get(col) for col in STOCK_COLUMNS))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows in a single transaction; returns rows written
+
+        A failed batch is logged, rolled back and counted in rows_failed, so
+        one bad batch doesn't abort the rest of a scrape.
+        """
+        if not self.buffer:
+            return 0
+
+        rows, self.buffer = self.buffer, []
+        start = time.perf_counter()
+        try:
+            with self.metrics.span('save', rows=len(rows)), self.conn:  # one BEGIN/COMMIT around the whole batch
+                self.conn.executemany(UPSERT_STOCK_SQL, rows)
+                if self.record_history:
+                    append_history(self.conn, rows)
+                if self.record_scores and self.defer_scores:
+                    self.pending_sectors |= touched_sectors(self.conn, rows)
+                elif self.record_scores:
+                    refresh_scores(self.conn, rows)
+        except Exception as e:
+            logger.error(f"Error saving batch of {len(rows)} rows: {str(e)}")
+            self.rows_failed += len(rows)
+            return 0
+        self.write_seconds += time.perf_counter() - start
+        self.rows_written += len(rows)
+        self.flushes += 1
+        logger.info(f"Flushed {len(rows)} rows to database")
+        return len(rows)
+
+    def stats(self):
+        """Rows written and write throughput so far"""
+        return {
+            'rows_written': self.rows_written,
+            'rows_failed': self.rows_failed,
+            'flushes': self.flushes,
+            'write_seconds': self.write_seconds,
+            'rows_per_sec': self.rows_written / self.write_seconds if self.write_seconds else 0.0
+        }
+
+    def refresh_pending_scores(self):
+        """Rank the sectors collected by deferred flushes"""
+        if not self.pending_sectors:
+            return []
+        try:
+            with self.metrics.span('score', sectors=len(self.pending_sectors)), self.conn:
+                sectors = refresh_scores(self.conn, sectors=self.pending_sectors)
+        except Exception as e:
+            logger.error(f"Error refreshing scores for {len(self.pending_sectors)} sectors: {str(e)}")
+            return []
+        self.pending_sectors = set()
+        return sectors
+
+    def close(self):
+        """Flush remaining rows, rank deferred sectors and close the connection"""
+        try:
+            self.flush()
+            self.refresh_pending_scores()
+        finally:
+            self.conn.close()
+        stats = self.stats()
+        logger.info(f"Writer closed: {stats['rows_written']} rows in {stats['flushes']} flushes "
+                    f"({stats['rows_per_sec']:.0f} rows/s)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class PayloadArchive:
+    """Content-addressed store of raw yfinance payloads
+
+    Each payload is canonical JSON, gzipped and stored once under its sha256
+    digest (objects/ab/cdef....json.gz), so an unchanged payload fetched again
+    only costs an index row. index.db records which digest each fetch of a
+    symbol produced.
+    """
+    def __init__(self, root="payload_archive"):
+        self.root = root
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS payloads (
+                symbol TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (symbol, fetched_at)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.commit()
+        self.stored = 0
+        self.deduplicated = 0
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:] + ".json.gz")
+
+    def store(self, symbol, info, fetched_at=None):
+        """Archive one payload and return its digest"""
+        data = json.dumps(info, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            self.deduplicated += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so a crash never leaves a truncated object behind
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=6))
+            os.replace(tmp_path, path)
+            self.stored += 1
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO payloads VALUES (?, ?, ?)",
+                              (symbol, fetched_at or time.time(), digest))
+        return digest
+
+    def load(self, digest):
+        with gzip.open(self.object_path(digest), 'rb') as f:
+            return json.loads(f.read())
+
+    def latest(self, symbols=None):
+        """(symbol, fetched_at, digest) of the newest payload per symbol"""
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT symbol, MAX(fetched_at), digest FROM payloads GROUP BY symbol ORDER BY symbol
+            ''').fetchall()
+        if symbols is not None:
+            wanted = set(symbols)
+            rows = [row for row in rows if row[0] in wanted]
+        return rows
+
+    def close(self):
+        self.conn.close()
+
+def _replay_chunk(root, entries):
+    """Process-pool worker: decompress and parse archived payloads into rows"""
+    rows = []
+    for symbol, fetched_at, digest in entries:
+        path = os.path.join(root, "objects", digest[:2], digest[2:] + ".json.gz")
+        try:
+            with gzip.open(path, 'rb') as f:
+                info = json.loads(f.read())
+        except (OSError, ValueError):
+            continue  # missing or corrupt object; the symbol is simply not replayed
+        stock_data = StockDataScraper.parse_stock_info(symbol, info)
+        rows.append((fetched_at, tuple(stock_data[col] for col in STOCK_COLUMNS)))
+    return rows
+
 class StockDataScraper:
-    def __init__(self, db_path="stocks.db"):
+    def __init__(self, db_path="stocks.db", fetcher=None, ticker_factory=None, metrics=None, downloader=None,
+                 archive=None):
         self.db_path = db_path
+        # fetch / parse / save spans; pass a recorder with a jsonl_path to log them
+        self.metrics = metrics or LatencyRecorder()
+        # Any callable symbol -> dict (or None) can replace the yfinance fetcher,
+        # e.g. a local stub for offline throughput measurements
+        self.fetcher = fetcher or self.fetch_stock_data_yfinance
+        # Builds the object whose `.info` is parsed; a fake can stand in for yf.Ticker
+        self.ticker_factory = ticker_factory or yf.Ticker
+        # Multi-ticker price history used by refresh_prices; same signature as yf.download
+        self.downloader = downloader or yf.download
+        # Optional PayloadArchive that keeps every raw `.info` payload for replay
+        self.archive = archive
         self.setup_database()
         
     def setup_database(self):
@@ -43,6 +549,47 @@ class StockDataScraper:
                 last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+
+        # Append-only dated snapshots; the (symbol, date) primary key is the
+        # index behind range and as-of lookups
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS stock_history (
+                symbol TEXT NOT NULL,
+                snapshot_date INTEGER NOT NULL,
+                {', '.join(f"{col} {'INTEGER' if col == 'volume' else 'REAL'}" for col in HISTORY_COLUMNS)},
+                PRIMARY KEY (symbol, snapshot_date)
+            ) WITHOUT ROWID
+        ''')
+
+        # Symbol universe imported from exchange listing files; delisted names
+        # stay in the table with active = 0 so they drop out of scrapes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS symbols (
+                symbol TEXT PRIMARY KEY,
+                name TEXT,
+                exchange TEXT NOT NULL,
+                isin TEXT,
+                active INTEGER NOT NULL DEFAULT 1,
+                updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_symbols_active ON symbols(active, exchange)")
+
+        # Sector-relative ranks and composite scores, rebuilt by refresh_scores
+        # after every write; stock_id is the stocks.id the row was computed from
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS stock_scores (
+                stock_id INTEGER PRIMARY KEY,
+                symbol TEXT NOT NULL,
+                sector TEXT NOT NULL,
+                {', '.join(f"{rank} REAL" for rank, _, _, _ in RANK_METRICS)},
+                {', '.join(f"{score} REAL" for score in SCORE_COLUMNS)}
+            )
+        ''')
+
+        ensure_indexes(conn)
+        if conn.execute("SELECT EXISTS (SELECT 1 FROM stocks) AND NOT EXISTS (SELECT 1 FROM stock_scores)").fetchone()[0]:
+            refresh_scores(conn)  # backfill databases scraped before scores existed
         
         conn.commit()
         conn.close()
@@ -68,7 +615,7 @@ class StockDataScraper:
             'ADANIENT.NS', 'ADANIPORTS.NS', 'AMBUJACEM.NS', 'BANKBARODA.NS', 'BERGEPAINT.NS',
             'BOSCHLTD.NS', 'CANBK.NS', 'CHOLAFIN.NS', 'COLPAL.NS', 'DABUR.NS',
             'DALBHARAT.NS', 'DEEPAKNTR.NS', 'FEDERALBNK.NS', 'GAIL.NS', 'GODREJIND.NS',
-            'HAVELLS.NS', 'HDFC.NS', 'HDFCAMC.NS', 'IBULHSGFIN.NS', 'INDIANB.NS',
+            'HAVELLS.NS', 'HDFCAMC.NS', 'IBULHSGFIN.NS', 'INDIANB.NS',
             'INDIGO.NS', 'INDUSTOWER.NS', 'IOC.NS', 'IRCTC.NS', 'JINDALSTEL.NS',
             'JSWENERGY.NS', 'JUBLFOOD.NS', 'LICHSGFIN.NS', 'M&M.NS', 'MARICO.NS',
             'MOTHERSON.NS', 'MPHASIS.NS', 'MRF.NS', 'MUTHOOTFIN.NS', 'NATIONALUM.NS',
@@ -78,47 +625,163 @@ class StockDataScraper:
         ]
         return nse_stocks[:count]
 
+    def import_universe(self, path, deactivate_missing=True):
+        """Load an exchange listing file into the symbols table
+
+        With `deactivate_missing`, symbols of the same exchange that are no
+        longer in the file are marked inactive (delisted or merged away).
+        Returns the number of listings read.
+        """
+        listings = list(read_symbol_listing(path))
+        rows = [(symbol, name, exchange, isin, int(active)) for symbol, name, exchange, isin, active in listings]
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO symbols (symbol, name, exchange, isin, active) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(symbol) DO UPDATE SET name = excluded.name, exchange = excluded.exchange,
+                        isin = excluded.isin, active = excluded.active, updated = CURRENT_TIMESTAMP
+                ''', rows)
+                if deactivate_missing and rows:
+                    conn.execute("CREATE TEMP TABLE IF NOT EXISTS listed (symbol TEXT PRIMARY KEY)")
+                    conn.execute("DELETE FROM listed")
+                    conn.executemany("INSERT OR IGNORE INTO listed VALUES (?)", [(row[0],) for row in rows])
+                    exchanges = sorted({row[2] for row in rows})
+                    conn.execute(f'''
+                        UPDATE symbols SET active = 0, updated = CURRENT_TIMESTAMP
+                        WHERE active = 1 AND exchange IN ({', '.join('?' * len(exchanges))})
+                          AND symbol NOT IN (SELECT symbol FROM listed)
+                    ''', exchanges)
+        finally:
+            conn.close()
+        logger.info(f"Imported {len(rows)} listings from {path}")
+        return len(rows)
+
+    def get_universe(self, exchanges=None):
+        """Active symbols from the symbols table, falling back to the built-in list
+
+        A company listed on several exchanges (same ISIN, or the same base
+        symbol when the ISIN is missing) appears once, on the exchange that
+        comes first in EXCHANGE_PREFERENCE.
+        """
+        where = "active = 1"
+        params = []
+        if exchanges:
+            where += f" AND exchange IN ({', '.join('?' * len(exchanges))})"
+            params = list(exchanges)
+        preference = ' '.join(f"WHEN '{exchange}' THEN {rank}" for rank, exchange in enumerate(EXCHANGE_PREFERENCE))
+        conn = sqlite3.connect(self.db_path)
+        try:
+            symbols = [row[0] for row in conn.execute(f"""
+                SELECT symbol FROM (
+                    SELECT symbol, ROW_NUMBER() OVER (
+                        PARTITION BY COALESCE(NULLIF(isin, ''),
+                                              CASE WHEN instr(symbol, '.') THEN substr(symbol, 1, instr(symbol, '.') - 1)
+                                                   ELSE symbol END)
+                        ORDER BY CASE exchange {preference} ELSE {len(EXCHANGE_PREFERENCE)} END, symbol
+                    ) AS listing
+                    FROM symbols WHERE {where}
+                ) WHERE listing = 1
+                ORDER BY symbol
+            """, params)]
+        finally:
+            conn.close()
+        return symbols or self.get_nse_top_stocks()
+
+    def refresh_prices(self, symbols=None, chunk_size=200, period="5d", rate=0.5):
+        """Refresh price and volume for many symbols with chunked multi-ticker downloads
+
+        Fundamentals stay on the slow per-symbol path; this costs one request per
+        `chunk_size` symbols. Only rows that already exist in `stocks` are
+        updated. Returns the number of rows updated.
+        """
+        if symbols is None:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                symbols = [row[0] for row in conn.execute("SELECT symbol FROM stocks ORDER BY symbol")]
+            finally:
+                conn.close()
+        limiter = TokenBucket(rate) if rate else None
+        updated = 0
+        start = time.perf_counter()
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        try:
+            for chunk_start in range(0, len(symbols), chunk_size):
+                chunk = symbols[chunk_start:chunk_start + chunk_size]
+                if limiter:
+                    limiter.acquire()
+                try:
+                    with self.metrics.span('fetch_prices', symbols=len(chunk)):
+                        frame = self.downloader(chunk, period=period, interval="1d", group_by="ticker",
+                                                auto_adjust=False, threads=True, progress=False)
+                except Exception as e:
+                    logger.error(f"Price download failed for chunk at {chunk_start}: {str(e)}")
+                    continue
+                quotes = latest_quotes(frame, chunk)
+                rows = [(price, volume, symbol) for symbol, (price, volume) in quotes.items()]
+                with self.metrics.span('save_prices', rows=len(rows)), conn:
+                    # last_updated is left alone: it tracks fundamentals freshness
+                    cursor = conn.executemany("UPDATE stocks SET price = ?, volume = ? WHERE symbol = ?", rows)
+                updated += cursor.rowcount
+                logger.info(f"Prices: {chunk_start + len(chunk)}/{len(symbols)} symbols, {len(quotes)} quoted")
+        finally:
+            conn.close()
+
+        logger.info(f"Price refresh complete: {updated} rows in {time.perf_counter() - start:.1f}s")
+        return updated
+
     def fetch_stock_data_yfinance(self, symbol):
         """Fetch stock data using yfinance"""
         try:
-            stock = yf.Ticker(symbol)
-            info = stock.info
-            
-            # Extract key fundamental metrics
-            stock_data = {
-                'symbol': symbol,
-                'name': info.get('longName', ''),
-                'sector': info.get('sector', ''),
-                'industry': info.get('industry', ''),
-                'market_cap': info.get('marketCap'),
-                'pe_ratio': info.get('forwardPE') or info.get('trailingPE'),
-                'pb_ratio': info.get('priceToBook'),
-                'roe': info.get('returnOnEquity'),
-                'debt_to_equity': info.get('debtToEquity'),
-                'current_ratio': info.get('currentRatio'),
-                'revenue_growth': info.get('revenueGrowth'),
-                'net_profit_margin': info.get('profitMargins'),
-                'dividend_yield': info.get('dividendYield'),
-                'price': info.get('currentPrice') or info.get('regularMarketPrice'),
-                'volume': info.get('volume')
-            }
-            
-            # Convert percentages to actual percentages
-            if stock_data['roe']:
-                stock_data['roe'] *= 100
-            if stock_data['revenue_growth']:
-                stock_data['revenue_growth'] *= 100
-            if stock_data['net_profit_margin']:
-                stock_data['net_profit_margin'] *= 100
-            if stock_data['dividend_yield']:
-                stock_data['dividend_yield'] *= 100
-                
-            return stock_data
+            with self.metrics.span('fetch', symbol=symbol):
+                info = self.ticker_factory(symbol).info
+            if self.archive:
+                with self.metrics.span('archive', symbol=symbol):
+                    self.archive.store(symbol, info)
+            with self.metrics.span('parse', symbol=symbol):
+                return self.parse_stock_info(symbol, info)
             
         except Exception as e:
             logger.error(f"Error fetching data for {symbol}: {str(e)}")
             return None
 
+    @staticmethod
+    def parse_stock_info(symbol, info):
+        """Turn a yfinance `info` payload into a stocks row"""
+        # Extract key fundamental metrics
+        stock_data = {
+            'symbol': symbol,
+            'name': info.get('longName', ''),
+            'sector': info.get('sector', ''),
+            'industry': info.get('industry', ''),
+            'market_cap': info.get('marketCap'),
+            'pe_ratio': info.get('forwardPE') or info.get('trailingPE'),
+            'pb_ratio': info.get('priceToBook'),
+            'roe': info.get('returnOnEquity'),
+            'debt_to_equity': info.get('debtToEquity'),
+            'current_ratio': info.get('currentRatio'),
+            'revenue_growth': info.get('revenueGrowth'),
+            'net_profit_margin': info.get('profitMargins'),
+            'dividend_yield': info.get('dividendYield'),
+            'price': info.get('currentPrice') or info.get('regularMarketPrice'),
+            'volume': info.get('volume')
+        }
+        
+        # Convert percentages to actual percentages
+        if stock_data['roe']:
+            stock_data['roe'] *= 100
+        if stock_data['revenue_growth']:
+            stock_data['revenue_growth'] *= 100
+        if stock_data['net_profit_margin']:
+            stock_data['net_profit_margin'] *= 100
+        if stock_data['dividend_yield']:
+            stock_data['dividend_yield'] *= 100
+            
+        return stock_data
+
     def save_to_database(self, stock_data):
         """Save stock data to SQLite database"""
         if not stock_data:
@@ -128,22 +791,13 @@ class StockDataScraper:
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO stocks (
-                    symbol, name, sector, industry, market_cap, pe_ratio, pb_ratio,
-                    roe, debt_to_equity, current_ratio, revenue_growth, 
-                    net_profit_margin, dividend_yield, price, volume
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                stock_data['symbol'], stock_data['name'], stock_data['sector'],
-                stock_data['industry'], stock_data['market_cap'], stock_data['pe_ratio'],
-                stock_data['pb_ratio'], stock_data['roe'], stock_data['debt_to_equity'],
-                stock_data['current_ratio'], stock_data['revenue_growth'],
-                stock_data['net_profit_margin'], stock_data['dividend_yield'],
-                stock_data['price'], stock_data['volume']
-            ))
-            
-            conn.commit()
+            with self.metrics.span('save', rows=1):
+                row = tuple(stock_data[col] for col in STOCK_COLUMNS)
+                cursor.execute(UPSERT_STOCK_SQL, row)
+                append_history(conn, [row])
+                refresh_scores(conn, [row])
+                
+                conn.commit()
             logger.info(f"Saved data for {stock_data['symbol']}")
             return True
             
@@ -153,9 +807,173 @@ class StockDataScraper:
         finally:
             conn.close()
 
-    def scrape_all_stocks(self, batch_size=10, delay=2):
-        """Main function to scrape all stocks with better rate limiting"""
-        stocks = self.get_nse_top_stocks()
+    def save_many(self, stock_rows, batch_size=100):
+        """Save many rows through one buffered connection; returns writer stats"""
+        with BulkStockWriter(self.db_path, batch_size, metrics=self.metrics, defer_scores=True) as writer:
+            for stock_data in stock_rows:
+                if stock_data:
+                    writer.add(stock_data)
+        return writer.stats()
+
+    def replay_archive(self, archive, symbols=None, workers=None, chunk_size=500):
+        """Rebuild stocks (and history) from archived payloads without the network
+
+        Decompression and parsing run in a process pool across all cores; rows
+        are written here by one connection. Each row keeps the time its payload
+        was fetched, so incremental refreshes still see its real age.
+        Returns the number of rows written.
+        """
+        entries = archive.latest(symbols)
+        chunks = [entries[i:i + chunk_size] for i in range(0, len(entries), chunk_size)]
+        written = 0
+        start = time.perf_counter()
+        logger.info(f"Replaying {len(entries)} archived payloads from {archive.root}...")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for parsed in executor.map(_replay_chunk, [archive.root] * len(chunks), chunks):
+                    if not parsed:
+                        continue
+                    with self.metrics.span('save', rows=len(parsed)), conn:
+                        rows = [row for _, row in parsed]
+                        conn.executemany(UPSERT_STOCK_SQL, rows)
+                        conn.executemany(
+                            "UPDATE stocks SET last_updated = datetime(?, 'unixepoch') WHERE symbol = ?",
+                            [(fetched_at, row[0]) for fetched_at, row in parsed])
+                        by_date = {}
+                        for fetched_at, row in parsed:
+                            by_date.setdefault(int(time.strftime('%Y%m%d', time.gmtime(fetched_at))), []).append(row)
+                        for date_key, date_rows in by_date.items():
+                            append_history(conn, date_rows, date_key)
+                    written += len(parsed)
+            with conn:
+                refresh_scores(conn)  # once at the end instead of per chunk
+        finally:
+            conn.close()
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"Replay complete: {written} rows in {elapsed:.1f}s "
+                    f"({written / elapsed if elapsed else 0:.0f} rows/s)")
+        return written
+
+    def get_stale_symbols(self, symbols=None, tier_ttls=None):
+        """Return the symbols that need a refresh, most important first
+
+        Symbols never scraped come first, then rows older than their tier TTL
+        ordered by market cap so the biggest names refresh before the tail.
+        """
+        if symbols is None:
+            symbols = self.get_universe()
+        ttls = dict(DEFAULT_TIER_TTLS, **(tier_ttls or {}))
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute('''
+                SELECT symbol, market_cap,
+                       (julianday('now') - julianday(last_updated)) * 86400 AS age_seconds
+                FROM stocks
+            ''').fetchall()
+        finally:
+            conn.close()
+        known = {symbol: (market_cap, age) for symbol, market_cap, age in rows}
+
+        missing = []
+        stale = []
+        for symbol in symbols:
+            if symbol not in known:
+                missing.append(symbol)
+                continue
+            market_cap, age = known[symbol]
+            if age is None or age >= ttls[market_cap_tier(market_cap)]:
+                stale.append((market_cap or 0, symbol))
+
+        stale.sort(key=lambda item: item[0], reverse=True)
+        result = missing + [symbol for _, symbol in stale]
+        logger.info(f"Incremental refresh: {len(missing)} new, {len(stale)} stale, "
+                    f"{len(symbols) - len(result)} fresh symbols skipped")
+        return result
+
+    def fetch_with_retry(self, symbol, limiter=None, max_retries=3, base_delay=1.0, max_delay=30.0):
+        """Fetch one symbol, retrying with jittered exponential backoff"""
+        for attempt in range(max_retries):
+            if limiter:
+                limiter.acquire()
+
+            try:
+                stock_data = self.fetcher(symbol)
+                if stock_data:
+                    return stock_data
+                logger.warning(f"Attempt {attempt + 1} returned no data for {symbol}")
+            except Exception as e:
+                logger.error(f"Attempt {attempt + 1} failed for {symbol}: {str(e)}")
+
+            if attempt < max_retries - 1:
+                # Full jitter keeps retrying workers from hitting the API in lockstep
+                backoff = min(max_delay, base_delay * (2 ** attempt))
+                time.sleep(random.uniform(0, backoff))
+
+        return None
+
+    def scrape_concurrent(self, stocks=None, workers=8, rate=2.0, burst=None, max_retries=3, base_delay=1.0,
+                          write_batch_size=50):
+        """Scrape stocks with a worker pool sharing one token-bucket rate limiter"""
+        if stocks is None:
+            stocks = self.get_universe()
+        limiter = TokenBucket(rate, burst) if rate else None
+        failed = 0
+        start = time.perf_counter()
+
+        logger.info(f"Starting concurrent scrape of {len(stocks)} stocks with {workers} workers at {rate or 'unlimited'} req/s...")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                BulkStockWriter(self.db_path, write_batch_size, metrics=self.metrics,
+                                defer_scores=len(stocks) >= SCORE_DEFER_ROWS) as writer:
+            futures = {
+                executor.submit(self.fetch_with_retry, symbol, limiter, max_retries, base_delay): symbol
+                for symbol in stocks
+            }
+
+            # Saving stays on this thread so SQLite only ever sees a single writer
+            for done, future in enumerate(as_completed(futures), 1):
+                symbol = futures[future]
+                stock_data = future.result()
+
+                if stock_data:
+                    writer.add(stock_data)
+                else:
+                    failed += 1
+                    logger.warning(f"Failed to process {symbol} after {max_retries} attempts")
+
+                if done % 25 == 0:
+                    logger.info(f"Progress: {done}/{len(stocks)}")
+
+        # Only rows whose batch actually committed count as scraped
+        successful = writer.rows_written
+        failed += writer.rows_failed
+        elapsed = time.perf_counter() - start
+        logger.info(f"Scraping complete! Success: {successful}, Failed: {failed} "
+                    f"in {elapsed:.1f}s ({len(stocks) / elapsed if elapsed else 0:.1f} symbols/s)")
+        return successful, failed
+
+    def scrape_all_stocks(self, batch_size=10, delay=2, workers=None, rate=2.0, incremental=False, tier_ttls=None):
+        """Main function to scrape all stocks with better rate limiting
+
+        Passing `workers` switches to the concurrent, token-bucket limited engine.
+        With `incremental=True` only symbols older than their tier TTL are fetched.
+        """
+        stocks = self.get_universe()
+        if incremental:
+            stocks = self.get_stale_symbols(stocks, tier_ttls)
+            if not stocks:
+                logger.info("All stocks are fresh, nothing to scrape")
+                return 0, 0
+
+        if workers:
+            return self.scrape_concurrent(stocks, workers=workers, rate=rate)
+
         successful = 0
         failed = 0
         
@@ -175,7 +993,7 @@ class StockDataScraper:
                 max_retries = 3
                 for attempt in range(max_retries):
                     try:
-                        stock_data = self.fetch_stock_data_yfinance(symbol)
+                        stock_data = self.fetcher(symbol)
                         
                         if stock_data and self.save_to_database(stock_data):
                             successful += 1
@@ -203,8 +1021,63 @@ class StockDataScraper:
         logger.info(f"Scraping complete! Success: {successful}, Failed: {failed}")
         return successful, failed
 
-    def get_stock_summary(self):
-        """Get summary of scraped data"""
+    def get_history(self, symbol, start=None, end=None):
+        """Dated snapshots for one symbol between start and end (inclusive)"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return pd.read_sql_query(f"""
+                SELECT snapshot_date, {', '.join(HISTORY_COLUMNS)}
+                FROM stock_history
+                WHERE symbol = ? AND snapshot_date BETWEEN ? AND ?
+                ORDER BY snapshot_date
+            """, conn, params=(symbol, to_date_key(start) if start else 0, to_date_key(end)))
+        finally:
+            conn.close()
+
+    def get_snapshot_as_of(self, date=None, symbols=None):
+        """Latest snapshot per symbol on or before `date` (default: today)
+
+        Drives one primary-key seek per symbol, so cost scales with the
+        number of symbols rather than the number of history rows.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if symbols is None:
+                symbols = [row[0] for row in conn.execute("SELECT symbol FROM stocks")]
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_symbols (symbol TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM wanted_symbols")
+            conn.executemany("INSERT OR IGNORE INTO wanted_symbols VALUES (?)", [(s,) for s in symbols])
+            return pd.read_sql_query(f"""
+                SELECT h.symbol, h.snapshot_date, {', '.join('h.' + col for col in HISTORY_COLUMNS)}
+                FROM wanted_symbols w  -- CROSS JOIN pins this as the outer loop
+                CROSS JOIN stock_history h ON h.symbol = w.symbol AND h.snapshot_date = (
+                    SELECT MAX(snapshot_date) FROM stock_history
+                    WHERE symbol = w.symbol AND snapshot_date <= :as_of
+                )
+                ORDER BY w.symbol
+            """, conn, params={'as_of': to_date_key(date)})
+        finally:
+            conn.close()
+
+    def export_columnar(self, out_dir, fmt='parquet', history=True):
+        """Write the snapshot and history as partitioned Parquet / Arrow IPC files (needs pyarrow)"""
+        from columnar_export import export_database
+        with self.metrics.span('export'):
+            counts = export_database(self.db_path, out_dir, fmt, history=history)
+        logger.info(f"Exported {counts} to {out_dir}")
+        return counts
+
+    def get_stock_summary(self, export_dir=None):
+        """Get summary of scraped data
+
+        With `export_dir` the summary is computed from a columnar export
+        (memory-mapped, aggregated in Arrow) instead of querying SQLite.
+        """
+        if export_dir:
+            from columnar_export import ColumnarAnalytics, print_summary
+            print_summary(ColumnarAnalytics(export_dir))
+            return
+
         conn = sqlite3.connect(self.db_path)
         
         # Get basic stats
@@ -231,12 +1104,58 @@ class StockDataScraper:
 
 # Usage example
 if __name__ == "__main__":
-    scraper = StockDataScraper()
+    parser = argparse.ArgumentParser(description="Scrape NSE stock fundamentals into SQLite")
+    parser.add_argument("--db", default="stocks.db", help="SQLite database path")
+    parser.add_argument("--workers", type=int, default=None, help="Use the concurrent engine with N workers")
+    parser.add_argument("--rate", type=float, default=2.0, help="Max requests per second across all workers")
+    parser.add_argument("--incremental", action="store_true", help="Only refresh symbols older than their tier TTL")
+    parser.add_argument("--migrate", action="store_true", help="Upgrade the database schema and indexes, then exit")
+    parser.add_argument("--universe", help="Import a listing CSV (NSE EQUITY_L.csv, BSE scrip list or a symbol column) first")
+    parser.add_argument("--refresh-prices", action="store_true",
+                        help="Only refresh price/volume with bulk multi-ticker downloads, then exit")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Symbols per bulk price request")
+    parser.add_argument("--archive", metavar="DIR", help="Keep every raw yfinance payload in this archive")
+    parser.add_argument("--replay", metavar="DIR", help="Rebuild the database from a payload archive, then exit")
+    parser.add_argument("--replay-workers", type=int, default=None, help="Processes used by --replay (default: all cores)")
+    parser.add_argument("--export", metavar="DIR", help="After scraping, export snapshot and history to DIR (needs pyarrow)")
+    parser.add_argument("--export-format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--metrics-log", help="Append fetch/parse/save spans to this JSON-lines file")
+    parser.add_argument("--profile", nargs="?", const="", metavar="OUT",
+                        help="Run the scrape under cProfile; print the top entries or write stats to OUT")
+    args = parser.parse_args()
+
+    archive = PayloadArchive(args.archive) if args.archive else None
+    scraper = StockDataScraper(args.db, metrics=LatencyRecorder(args.metrics_log), archive=archive)
+    if args.migrate:
+        # setup_database already brought the schema up to date
+        print(f"✅ {args.db} migrated")
+        raise SystemExit(0)
+    if args.replay:
+        replay_archive = PayloadArchive(args.replay)
+        written = scraper.replay_archive(replay_archive, workers=args.replay_workers)
+        replay_archive.close()
+        print(f"✅ Replayed {written} stocks from {args.replay}")
+        raise SystemExit(0)
+    if args.universe:
+        print(f"📋 Imported {scraper.import_universe(args.universe)} listings from {args.universe}")
+    if args.refresh_prices:
+        updated = scraper.refresh_prices(chunk_size=args.chunk_size)
+        print(f"✅ Refreshed prices for {updated} stocks")
+        raise SystemExit(0)
     
     # Scrape all stocks
-    success, failed = scraper.scrape_all_stocks()
+    scrape_kwargs = dict(workers=args.workers, rate=args.rate, incremental=args.incremental)
+    if args.profile is not None:
+        success, failed = profile_call(scraper.scrape_all_stocks, output=args.profile or None, **scrape_kwargs)
+    else:
+        success, failed = scraper.scrape_all_stocks(**scrape_kwargs)
     
     # Show summary
-    scraper.get_stock_summary()
+    if args.export:
+        scraper.export_columnar(args.export, args.export_format)
+    scraper.get_stock_summary(args.export)
     
     print(f"\n✅ Scraping completed: {success} successful, {failed} failed")
+    print("\n⏱️  Stage latency:")
+    print(scraper.metrics.format_table())
+    scraper.metrics.close()
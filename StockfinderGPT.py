@@ -3,22 +3,884 @@ from google import genai
 from google.genai import types
 import json
 import re
-from typing import List, Dict, Any, Generator
+import hashlib
+from typing import List, Dict, Any, Generator, AsyncGenerator, Optional, Tuple
 import time
 import sys
 import asyncio
+import threading
+import operator
+import queue
+import difflib
+from pathlib import Path
+from contextlib import contextmanager
+from functools import lru_cache
+from collections import OrderedDict, deque
 from concurrent.futures import ThreadPoolExecutor
 
+from instrumentation import LatencyRecorder, profile_call
+
+try:
+    import numpy as np
+except ImportError:  # only needed by the optional columnar engine
+    np = None
+
+# Screen presets picked by keyword; the first preset whose keyword appears in the
+# message wins. Both the SQL path and the columnar engine evaluate these.
+SCREEN_PRESETS = [
+    {'keywords': ['value', 'cheap', 'undervalued'],
+     'filters': [('pe_ratio', '<', 15), ('pb_ratio', '<', 2), ('roe', '>', 10)],
+     'sort': 'pe_ratio', 'descending': False, 'limit': 15},
+    {'keywords': ['growth', 'growing', 'high growth'],
+     'filters': [('revenue_growth', '>', 15), ('roe', '>', 20)],
+     'sort': 'revenue_growth', 'descending': True, 'limit': 15},
+    {'keywords': ['dividend', 'income', 'yield'],
+     'filters': [('dividend_yield', '>', 2)],
+     'sort': 'dividend_yield', 'descending': True, 'limit': 15},
+    {'keywords': ['safe', 'stable', 'low risk'],
+     'filters': [('debt_to_equity', '<', 0.5), ('current_ratio', '>', 1.5), ('roe', '>', 10)],
+     'sort': 'debt_to_equity', 'descending': False, 'limit': 15},
+    {'keywords': ['large cap', 'big', 'large'],
+     'filters': [('market_cap', '>', 50000)],
+     'sort': 'market_cap', 'descending': True, 'limit': 15},
+]
+
+DEFAULT_SCREEN = {
+    'keywords': [],
+    'filters': [('roe', '>', 15), ('pe_ratio', '<', 30), ('debt_to_equity', '<', 1)],
+    'sort': 'roe', 'descending': True, 'limit': 15
+}
+
+# Numeric columns a screen may filter or sort on
+NUMERIC_FIELDS = {
+    'market_cap', 'pe_ratio', 'pb_ratio', 'roe', 'debt_to_equity', 'current_ratio',
+    'revenue_growth', 'net_profit_margin', 'dividend_yield', 'price', 'volume'
+}
+
+# Sector-relative composites (0-100, 100 = best in sector) precomputed by the
+# scraper in stock_scores; screens sorted on these are index walks over that table
+SCORE_FIELDS = {'value_score', 'growth_score', 'quality_score', 'composite_score'}
+
+# Where smaller is better, so "best pe stocks" sorts ascending
+LOWER_IS_BETTER = {'pe_ratio', 'pb_ratio', 'debt_to_equity'}
+
+# Theme words that pick which score a sector-relative screen sorts on
+SCORE_THEMES = [
+    ('value_score', ['value', 'cheap', 'undervalued']),
+    ('growth_score', ['growth', 'growing']),
+    ('quality_score', ['quality', 'safe', 'stable', 'strong']),
+]
+
+# "best ...", "cheapest in its sector", "compared to peers" and the like
+RELATIVE_RE = re.compile(
+    r"\bbest\b|\btop rated\b|\bpeers?\b|\brelative\b"
+    r"|\b(?:in|within|for|vs|versus|against)\s+(?:its|their|the|each|every)?\s*(?:own\s+)?sectors?\b"
+)
+
+# Phrases users write for each column, longest first so "dividend yield" beats "yield"
+FIELD_ALIASES = [
+    ('price to earnings', 'pe_ratio'), ('price to book', 'pb_ratio'), ('return on equity', 'roe'),
+    ('debt to equity', 'debt_to_equity'), ('dividend yield', 'dividend_yield'),
+    ('revenue growth', 'revenue_growth'), ('sales growth', 'revenue_growth'),
+    ('profit margin', 'net_profit_margin'), ('net margin', 'net_profit_margin'),
+    ('current ratio', 'current_ratio'), ('market cap', 'market_cap'),
+    ('p/e', 'pe_ratio'), ('pe', 'pe_ratio'), ('p/b', 'pb_ratio'), ('pb', 'pb_ratio'),
+    ('roe', 'roe'), ('d/e', 'debt_to_equity'), ('debt', 'debt_to_equity'),
+    ('dividend', 'dividend_yield'), ('yield', 'dividend_yield'), ('growth', 'revenue_growth'),
+    ('margin', 'net_profit_margin'), ('price', 'price'), ('volume', 'volume'),
+]
+
+OPERATOR_WORDS = [
+    ('greater than or equal to', '>='), ('less than or equal to', '<='), ('at least', '>='), ('at most', '<='),
+    ('greater than', '>'), ('more than', '>'), ('higher than', '>'), ('over', '>'), ('above', '>'),
+    ('less than', '<'), ('lower than', '<'), ('under', '<'), ('below', '<'),
+    ('>=', '>='), ('<=', '<='), ('>', '>'), ('<', '<'),
+]
+
+# yfinance sector names and the words people use for them
+SECTOR_ALIASES = {
+    'Financial Services': ['bank', 'banks', 'banking', 'financial', 'finance', 'nbfc', 'insurance'],
+    'Technology': ['tech', 'technology', 'software', 'it services'],
+    'Healthcare': ['pharma', 'pharmaceutical', 'healthcare', 'hospital', 'hospitals'],
+    'Consumer Defensive': ['fmcg', 'consumer staples'],
+    'Consumer Cyclical': ['auto', 'automobile', 'automobiles', 'retail'],
+    'Energy': ['energy', 'oil', 'gas'],
+    'Basic Materials': ['metal', 'metals', 'steel', 'cement', 'chemical', 'chemicals', 'mining'],
+    'Utilities': ['power', 'utility', 'utilities'],
+    'Communication Services': ['telecom', 'media'],
+    'Industrials': ['industrial', 'industrials', 'infra', 'infrastructure', 'capital goods'],
+    'Real Estate': ['real estate', 'realty'],
+}
+
+_FIELD_PATTERN = '|'.join(re.escape(alias) for alias, _ in FIELD_ALIASES)
+_OPERATOR_PATTERN = '|'.join(re.escape(word) for word, _ in OPERATOR_WORDS)
+COMPARISON_RE = re.compile(
+    rf"(?<![a-z])({_FIELD_PATTERN})(?:\s+ratio)?(?:\s+(?:is|of))?\s*({_OPERATOR_PATTERN})\s*(-?\d+(?:\.\d+)?)\s*%?"
+)
+# EXPLAIN QUERY PLAN steps that walk an index ("SCAN stocks USING COVERING INDEX ...")
+INDEX_STEP_RE = re.compile(r"\bUSING (?:COVERING )?INDEX\b")
+FIELD_RE = re.compile(rf"(?<![a-z])({_FIELD_PATTERN})(?![a-z])")
+QUALIFIER_RE = re.compile(rf"\b(low|lowest|high|highest|cheapest)\s+({_FIELD_PATTERN})(?![a-z])")
+# Result counts: "top 5", "best 10", "5 best", "3 banking stocks", "10 pharma companies".
+# A number a comparison already used ("pe under 12 stocks") is skipped by parse_criteria
+LIMIT_RE = re.compile(r"\b(?:top|best|first)\s+(\d+)\b"
+                      r"|\b(\d+)\s+(?:(?:best|top)\b|(?:[a-z]+\s+){0,2}?(?:stocks|companies)\b)")
+
+class ScreenCriteria:
+    """
+    Structured screen: numeric filters, optional sector, sort column and limit
+    """
+    def __init__(self, filters=None, sector: Optional[str] = None, sort: str = 'market_cap',
+                 descending: bool = True, limit: int = 15):
+        self.filters = list(filters or [])  # [(field, op, value), ...]
+        self.sector = sector
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+
+    @classmethod
+    def from_preset(cls, preset: Dict[str, Any]) -> 'ScreenCriteria':
+        return cls(preset['filters'], None, preset['sort'], preset['descending'], preset['limit'])
+
+    def set_filter(self, field: str, op: str, value: float):
+        """Add a filter, replacing any existing bound on the same side of the field"""
+        side = op[0]
+        self.filters = [f for f in self.filters if not (f[0] == field and f[1][0] == side)]
+        self.filters.append((field, op, value))
+
+    def shape(self) -> Tuple:
+        """Everything that determines the SQL text; values are bound separately"""
+        return (tuple((field, op) for field, op, _ in self.filters),
+                self.sector is not None, self.sort, self.descending)
+
+    def params(self) -> Tuple:
+        values = tuple(value for _, _, value in self.filters)
+        if self.sector is not None:
+            values += (self.sector,)
+        return values + (self.limit,)
+
+    def __repr__(self):
+        return (f"ScreenCriteria(filters={self.filters!r}, sector={self.sector!r}, "
+                f"sort={self.sort!r}, descending={self.descending!r}, limit={self.limit!r})")
+
+def parse_criteria(message: str) -> ScreenCriteria:
+    """
+    Parse a user message into ScreenCriteria
+
+    A keyword preset (value, growth, dividend, ...) supplies the starting point;
+    explicit comparisons such as "ROE over 20", a sector, "low PE" style sort
+    hints and "top N" are layered on top of it.
+    """
+    text = message.lower()
+    preset = next((p for p in SCREEN_PRESETS if any(word in text for word in p['keywords'])), None)
+    criteria = ScreenCriteria.from_preset(preset) if preset else ScreenCriteria()
+    aliases = dict(FIELD_ALIASES)
+    operators = dict(OPERATOR_WORDS)
+    explicit = False
+
+    if RELATIVE_RE.search(text):
+        # Rank against sector peers instead of applying absolute cut-offs
+        theme = next((score for score, words in SCORE_THEMES if any(word in text for word in words)), None)
+        metric = FIELD_RE.search(text)
+        if theme or not preset:
+            if theme or not metric:
+                criteria = ScreenCriteria(sort=theme or 'composite_score', descending=True)
+            else:
+                # "best pe stocks" names its yardstick; the composite is only for a bare "best"
+                field = aliases[metric.group(1)]
+                criteria = ScreenCriteria(sort=field, descending=field not in LOWER_IS_BETTER)
+                if field == 'pe_ratio':
+                    criteria.set_filter('pe_ratio', '>', 0)  # negative PE means losses, not cheapness
+            explicit = True
+
+    used = []  # spans consumed by comparisons, so their numbers are never read as a limit
+    for match in COMPARISON_RE.finditer(text):
+        alias, word, number = match.groups()
+        criteria.set_filter(aliases[alias], operators[word], float(number))
+        used.append(match.span())
+        explicit = True
+
+    qualifier = QUALIFIER_RE.search(text)
+    if qualifier:
+        criteria.sort = aliases[qualifier.group(2)]
+        criteria.descending = qualifier.group(1).startswith('high')
+        if criteria.sort == 'pe_ratio' and not criteria.descending:
+            criteria.set_filter('pe_ratio', '>', 0)  # negative PE means losses, not cheapness
+        explicit = True
+
+    for sector, words in SECTOR_ALIASES.items():
+        if any(re.search(rf"\b{re.escape(word)}\b", text) for word in words):
+            criteria.sector = sector
+            explicit = True
+            break
+
+    limit = LIMIT_RE.search(text)
+    while limit:
+        # "over 20 best 3" matches "20 best" first, so step one character, not one match
+        if not any(start < limit.end() and limit.start() < end for start, end in used):
+            criteria.limit = max(1, min(100, int(limit.group(1) or limit.group(2))))
+            break
+        limit = LIMIT_RE.search(text, limit.start() + 1)
+
+    if not preset and not explicit:
+        # Nothing recognisable: fall back to the default quality screen
+        default = ScreenCriteria.from_preset(DEFAULT_SCREEN)
+        default.limit = criteria.limit
+        return default
+    return criteria
+
+@lru_cache(maxsize=256)
+def _compile_shape(shape: Tuple) -> str:
+    filters, has_sector, sort, descending = shape
+    for field, op in filters:
+        if field not in NUMERIC_FIELDS or op not in ColumnarScreenEngine.OPS:
+            raise ValueError(f"Unsupported filter: {field} {op}")
+    if sort not in NUMERIC_FIELDS and sort not in SCORE_FIELDS:
+        raise ValueError(f"Unsupported sort column: {sort}")
+    direction = "DESC" if descending else "ASC"
+
+    if sort in SCORE_FIELDS:
+        # Walk the score index and look each stock up by id; CROSS JOIN keeps
+        # stock_scores as the outer loop so the index order is the result order
+        conditions = [f"s.{field} {op} ?" for field, op in filters]
+        if has_sector:
+            conditions.append("sc.sector = ?")
+        conditions.append(f"sc.{sort} IS NOT NULL")
+        return (f"SELECT s.*, {', '.join(f'sc.{score}' for score in sorted(SCORE_FIELDS))} "
+                f"FROM stock_scores sc CROSS JOIN stocks s ON s.id = sc.stock_id "
+                f"WHERE {' AND '.join(conditions)} "
+                f"ORDER BY sc.{sort} {direction}, sc.stock_id {direction} LIMIT ?")
+
+    conditions = [f"{field} {op} ?" for field, op in filters]
+    if has_sector:
+        conditions.append("sector = ?")
+    if sort not in {field for field, _ in filters}:
+        conditions.append(f"{sort} IS NOT NULL")
+    return (f"SELECT * FROM stocks WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {sort} {direction}, id {direction} LIMIT ?")
+
+def compile_criteria(criteria: ScreenCriteria) -> Tuple[str, Tuple]:
+    """
+    Compile criteria to parameterized SQL
+
+    The SQL text depends only on the filter shape and is memoized, so repeated
+    shapes produce the identical statement and hit sqlite3's per-connection
+    prepared-statement cache instead of being re-parsed.
+    """
+    return _compile_shape(criteria.shape()), criteria.params()
+
+class ColumnarScreenEngine:
+    """
+    In-memory columnar copy of the stocks table for vectorized screening
+    """
+    OPS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '=': operator.eq}
+
+    def __init__(self, db_path: str):
+        if np is None:
+            raise ImportError("numpy is required for the columnar screening engine")
+        self.db_path = db_path
+        # A dedicated connection: PRAGMA data_version only changes when *other*
+        # connections commit, which is exactly what a scraper write looks like
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.columns = []
+        self.stock_width = 0  # leading columns that come from stocks; scores follow
+        self.rows = []
+        self.arrays = {}
+        self.reloads = 0
+
+    def refresh(self) -> bool:
+        """
+        Reload the snapshot if the database changed since the last load
+        """
+        with self.lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self.data_version:
+                return False
+
+            scores = ', '.join(f"sc.{score}" for score in sorted(SCORE_FIELDS))
+            try:
+                cursor = self.conn.execute(f"SELECT s.*, {scores} FROM stocks s "
+                                           f"LEFT JOIN stock_scores sc ON sc.stock_id = s.id ORDER BY s.id")
+            except sqlite3.OperationalError:  # database predates stock_scores
+                cursor = self.conn.execute(f"SELECT *, {', '.join(f'NULL AS {score}' for score in sorted(SCORE_FIELDS))} "
+                                           f"FROM stocks ORDER BY id")
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+
+            arrays = {}
+            for i, column in enumerate(columns):
+                values = [row[i] for row in rows]
+                if all(value is None or isinstance(value, (int, float)) for value in values):
+                    arrays[column] = np.array(values, dtype=float)  # NULL -> NaN
+                else:
+                    arrays[column] = np.array(values, dtype=object)
+
+            self.columns, self.rows, self.arrays = columns, rows, arrays
+            self.stock_width = len(columns) - len(SCORE_FIELDS)
+            self.data_version = version
+            self.reloads += 1
+            return True
+
+    def screen(self, criteria: 'ScreenCriteria') -> List[Dict]:
+        """
+        Evaluate a screen with boolean masks and partial top-k selection
+
+        Matches the SQL path exactly: NaN fails every comparison like NULL,
+        NULL sorts lowest, and ties break on id in the sort direction.
+        """
+        self.refresh()
+        arrays = self.arrays
+        if not self.rows:
+            return []
+        sort, limit = criteria.sort, criteria.limit
+
+        mask = np.ones(len(self.rows), dtype=bool)
+        for field, op, value in criteria.filters:
+            mask &= self.OPS[op](arrays[field], value)
+        if criteria.sector is not None:
+            mask &= arrays['sector'] == criteria.sector
+        if sort not in {field for field, _, _ in criteria.filters}:
+            mask &= ~np.isnan(arrays[sort])
+        candidates = np.flatnonzero(mask)
+
+        keys = arrays[sort][candidates]
+        ids = arrays['id'][candidates]
+        if criteria.descending:
+            keys, ids = -keys, -ids
+
+        if len(candidates) > limit:
+            # Keep everything tied with the k-th key so the id tie-break stays exact
+            kth = np.partition(keys, limit - 1)[limit - 1]
+            keep = keys <= kth
+            candidates, keys, ids = candidates[keep], keys[keep], ids[keep]
+
+        order = np.lexsort((ids, keys))[:limit]
+        # Like the SQL path, score columns are only returned by score screens
+        width = len(self.columns) if sort in SCORE_FIELDS else self.stock_width
+        columns = self.columns[:width]
+        return [dict(zip(columns, self.rows[i][:width])) for i in candidates[order]]
+
+    def close(self):
+        self.conn.close()
+
+# Everyday names for companies whose listed name or symbol people rarely type
+COMPANY_ALIASES = {
+    'infosys': ['INFY.NS', 'INFOSYS.NS'], 'tcs': ['TCS.NS'], 'reliance': ['RELIANCE.NS'],
+    'hul': ['HINDUNILVR.NS'], 'hindustan unilever': ['HINDUNILVR.NS'], 'sbi': ['SBIN.NS'],
+    'state bank': ['SBIN.NS'], 'l&t': ['LT.NS'], 'larsen': ['LT.NS'], 'airtel': ['BHARTIARTL.NS'],
+    'maruti': ['MARUTI.NS'], 'm&m': ['M&M.NS'], 'mahindra': ['M&M.NS'], 'kotak': ['KOTAKBANK.NS'],
+    'icici': ['ICICIBANK.NS'], 'axis': ['AXISBANK.NS'], 'hcl': ['HCLTECH.NS'], 'lic': ['LICI.NS'],
+    'tech mahindra': ['TECHM.NS'], 'ultratech': ['ULTRACEMCO.NS'], 'nestle': ['NESTLEIND.NS'],
+    'dr reddy': ['DRREDDY.NS'], 'dr reddys': ['DRREDDY.NS'], 'sun pharma': ['SUNPHARMA.NS'],
+    'bajaj auto': ['BAJAJ-AUTO.NS'], 'hero': ['HEROMOTOCO.NS'], 'eicher': ['EICHERMOT.NS'],
+    'apollo': ['APOLLOHOSP.NS'], 'divis': ['DIVISLAB.NS'], 'zomato': ['ZOMATO.NS'],
+}
+
+# Legal suffixes and leading articles dropped from company names before they
+# become aliases ("The Tata Power Company Limited" -> "tata power")
+NAME_SUFFIXES = {'limited', 'ltd', 'corporation', 'corp', 'company', 'co', 'inc', 'plc'}
+NAME_PREFIXES = {'the', 'a', 'an'}
+
+# Words that never resolve to a company on their own, even when they equal a
+# symbol or a one-word name; the screener's own vocabulary is added below
+ENTITY_STOPWORDS = {
+    'a', 'an', 'and', 'or', 'the', 'is', 'are', 'be', 'of', 'in', 'on', 'at', 'by', 'for', 'to', 'from',
+    'me', 'my', 'i', 'you', 'we', 'it', 'its', 'their', 'them', 'this', 'that', 'these', 'those', 'with',
+    'vs', 'versus', 'about', 'than', 'what', 'which', 'who', 'how', 'why', 'should', 'can', 'could', 'would',
+    'show', 'find', 'compare', 'tell', 'more', 'less', 'give', 'list', 'get', 'want', 'like', 'please',
+    'stock', 'stocks', 'share', 'shares', 'company', 'companies', 'buy', 'sell', 'hold', 'invest',
+    'investment', 'portfolio', 'best', 'good', 'top', 'any', 'all', 'one', 'first', 'second', 'last',
+    'india', 'indian', 'market', 'sector', 'sectors', 'peers', 'ratio', 'price', 'cap', 'small', 'mid',
+    'now', 'today', 'year', 'long', 'term', 'short', 'high', 'low', 'safe', 'cheap', 'better', 'worse',
+}
+ENTITY_STOPWORDS.update(word for alias, _ in FIELD_ALIASES for word in alias.split())
+ENTITY_STOPWORDS.update(word for words in SECTOR_ALIASES.values() for phrase in words for word in phrase.split())
+ENTITY_STOPWORDS.update(word for preset in SCREEN_PRESETS for phrase in preset['keywords'] for word in phrase.split())
+
+ENTITY_TOKEN_RE = re.compile(r"[a-z0-9&]+")
+ENTITY_RAW_TOKEN_RE = re.compile(r"[A-Za-z0-9&]+")
+
+class EntityResolver:
+    """
+    Finds the companies named in a message in one pass over its words
+
+    Full symbols, normalized company names and COMPANY_ALIASES are tokenized
+    into a lowercase word trie; a message is scanned left to right taking the
+    longest match at each position. Bare symbols go into a separate trie that
+    only matches words typed in uppercase, so "a good idea" is not IDEA.NS.
+    Words that match nothing can be fuzzy-matched against single-word names
+    and aliases (typos like "infosis"). The tries are rebuilt only when
+    PRAGMA data_version says the database changed.
+    """
+    def __init__(self, db_path: str, fuzzy: bool = True, fuzzy_cutoff: float = 0.85):
+        self.db_path = db_path
+        self.fuzzy = fuzzy
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.trie = {}
+        self.symbol_trie = {}  # uppercase bare symbols ("INFY"), matched case-sensitively
+        self.words_by_initial = {}  # first letter -> single-word aliases, for fuzzy matching
+        self.fuzzy_memo = {}
+        self.rebuilds = 0
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return ENTITY_TOKEN_RE.findall(text.lower())
+
+    @staticmethod
+    def distinctive(tokens: List[str]) -> bool:
+        # One-word aliases must be distinctive; multi-word names always are
+        return bool(tokens) and not (len(tokens) == 1 and (tokens[0].lower() in ENTITY_STOPWORDS or len(tokens[0]) < 2))
+
+    def aliases_for(self, symbol: str, name: Optional[str]) -> List[List[str]]:
+        """Lowercase aliases: the suffixed symbol ("infy ns") and the normalized name"""
+        aliases = [self.tokenize(symbol)]
+        if name:
+            words = self.tokenize(name)
+            while words and words[0] in NAME_PREFIXES:
+                words.pop(0)
+            while words and words[-1] in NAME_SUFFIXES:
+                words.pop()
+            aliases.append(words)
+        return [tokens for tokens in aliases if self.distinctive(tokens)]
+
+    def symbol_alias(self, symbol: str) -> List[str]:
+        """The bare symbol as uppercase tokens, or [] when it is too ordinary to match"""
+        tokens = [token.upper() for token in self.tokenize(symbol.split('.')[0])]
+        return tokens if self.distinctive(tokens) else []
+
+    def refresh(self) -> bool:
+        """
+        Rebuild the trie if the database changed since the last build
+        """
+        with self.lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self.data_version:
+                return False
+
+            trie = {}
+            symbol_trie = {}
+            ids_by_symbol = {}
+
+            def insert(root, tokens, stock_id):
+                node = root
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node.setdefault(None, []).append(stock_id)  # None marks the end of an alias
+
+            try:
+                stocks = self.conn.execute("SELECT id, symbol, name FROM stocks ORDER BY id").fetchall()
+            except sqlite3.OperationalError:
+                stocks = []  # nothing scraped yet: no company can be mentioned
+            for stock_id, symbol, name in stocks:
+                ids_by_symbol[symbol] = stock_id
+                for tokens in self.aliases_for(symbol, name):
+                    insert(trie, tokens, stock_id)
+                tokens = self.symbol_alias(symbol)
+                if tokens:
+                    insert(symbol_trie, tokens, stock_id)
+            for alias, symbols in COMPANY_ALIASES.items():
+                for symbol in symbols:
+                    if symbol in ids_by_symbol:
+                        insert(trie, self.tokenize(alias), ids_by_symbol[symbol])
+
+            words_by_initial = {}
+            for word, node in trie.items():
+                if None in node and len(word) >= 4:
+                    words_by_initial.setdefault(word[0], []).append(word)
+
+            self.trie, self.symbol_trie, self.words_by_initial = trie, symbol_trie, words_by_initial
+            self.fuzzy_memo = {}
+            self.data_version = version
+            self.rebuilds += 1
+            return True
+
+    def fuzzy_word(self, word: str) -> Optional[str]:
+        if word not in self.fuzzy_memo:
+            candidates = self.words_by_initial.get(word[0], [])
+            match = difflib.get_close_matches(word, candidates, n=1, cutoff=self.fuzzy_cutoff)
+            self.fuzzy_memo[word] = match[0] if match else None
+        return self.fuzzy_memo[word]
+
+    @staticmethod
+    def longest_match(trie: Dict, tokens: List[str], i: int) -> Tuple[Optional[List[int]], int]:
+        """(stock ids, end) of the longest alias in `trie` starting at tokens[i]"""
+        node, match, end = trie, None, i
+        for j in range(i, len(tokens)):
+            node = node.get(tokens[j])
+            if node is None:
+                break
+            if None in node:
+                match, end = node[None], j + 1
+        return match, end
+
+    def resolve(self, message: str) -> List[int]:
+        """
+        Stock ids of every company mentioned, in order of first mention
+        """
+        self.refresh()
+        trie, symbol_trie = self.trie, self.symbol_trie
+        raw_tokens = ENTITY_RAW_TOKEN_RE.findall(message)
+        tokens = [token.lower() for token in raw_tokens]
+        found = []
+        i = 0
+        while i < len(tokens):
+            match, end = self.longest_match(trie, tokens, i)
+            symbol_match, symbol_end = self.longest_match(symbol_trie, raw_tokens, i)
+            if symbol_match is not None and symbol_end > end:
+                match, end = symbol_match, symbol_end
+            if match is None and self.fuzzy and len(tokens[i]) >= 4 and tokens[i] not in ENTITY_STOPWORDS:
+                word = self.fuzzy_word(tokens[i])
+                if word is not None:
+                    match, end = trie[word][None], i + 1
+            if match is None:
+                i += 1
+                continue
+            for stock_id in match:
+                if stock_id not in found:
+                    found.append(stock_id)
+            i = end
+        return found
+
+    def close(self):
+        self.conn.close()
+
+class ReadConnectionPool:
+    """
+    Small pool of read-only SQLite connections shared by executor threads
+    """
+    def __init__(self, db_path: str, size: int = 4):
+        self.db_path = db_path
+        self.size = size
+        self.idle = queue.LifoQueue()  # LIFO keeps the warmest connection in use
+        self.created = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, opening a new one until the pool is full"""
+        if self.closed:
+            raise RuntimeError("connection pool is closed")
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_open = self.created < self.size
+                if can_open:
+                    self.created += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            else:
+                conn = self.idle.get()  # wait for another thread to return one
+
+        try:
+            yield conn
+        finally:
+            if self.closed:
+                conn.close()
+            else:
+                self.idle.put(conn)
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class ResponseCache:
+    """
+    On-disk LLM response cache with a TTL and size-bounded LRU eviction
+    """
+    def __init__(self, path: str = "llm_cache.db", ttl_seconds: float = 24 * 3600,
+                 max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, config: Any, prompt: str) -> str:
+        """
+        Hash of everything that determines the model output
+        """
+        if hasattr(config, 'model_dump_json'):
+            config = config.model_dump_json(exclude_none=True)
+        payload = json.dumps({'model': model, 'config': str(config), 'prompt': prompt}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                              (key, response, size, now, now))
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+            # Evict least recently used entries until we are back under the byte budget
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, old_size in self.conn.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    total -= old_size
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
+
+    def close(self):
+        self.conn.close()
+
+class ContextPromptBuilder:
+    """
+    Token-budgeted prompt builder for one conversation
+
+    The rendered system prefix is cached, recent turns are kept verbatim while
+    they fit the budget, and turns that fall out of the window are folded once
+    into a running summary instead of being dropped.
+    """
+    CLOSING = ("Respond naturally and conversationally. "
+               "Use the stock data to provide specific recommendations when relevant.")
+    STOCK_COLUMNS = [('symbol', 'Symbol'), ('name', 'Name'), ('sector', 'Sector'), ('pe_ratio', 'PE'),
+                     ('pb_ratio', 'PB'), ('roe', 'ROE%'), ('debt_to_equity', 'D/E'),
+                     ('revenue_growth', 'RevG%'), ('dividend_yield', 'Div%')]
+    # Added when the screen returned sector-relative scores
+    SCORE_COLUMNS = [('value_score', 'ValuePct'), ('growth_score', 'GrowthPct'), ('quality_score', 'QualityPct')]
+
+    def __init__(self, system_prompt: str, token_budget: int = 3000, max_stocks: int = 10,
+                 max_turn_tokens: int = 400, summary_budget: int = 300):
+        self.token_budget = token_budget
+        self.max_stocks = max_stocks
+        self.max_turn_tokens = max_turn_tokens
+        self.summary_budget = summary_budget
+        self.prefix = f"{system_prompt}\n\n"
+        self.prefix_tokens = self.estimate_tokens(self.prefix)
+        # The current message may take at most half of what the fixed parts leave
+        free = token_budget - self.prefix_tokens - self.estimate_tokens(self.CLOSING) - summary_budget
+        self.max_message_tokens = max(max_turn_tokens // 2, free // 2)
+        self.reset()
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Cheap token estimate (~4 characters per token) without a tokenizer"""
+        return len(text) // 4 + 1
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        max_chars = max_tokens * 4
+        return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+    def reset(self):
+        """Forget cached turns and the running summary (e.g. after /clear)"""
+        self.rendered_turns = []  # (text, tokens) per history entry, rendered once
+        self.summary_lines = []
+        self.summary_tokens = 0
+        self.summarized_count = 0  # history entries already folded into the summary
+        self.last_stats = {}
+
+    def render_stocks(self, stock_data: List[Dict], budget: int) -> str:
+        """Compact pipe-separated table, trimmed to fit the token budget"""
+        if not stock_data or budget <= 0:
+            return ""
+
+        def cell(stock, column):
+            value = stock.get(column)
+            if value is None:
+                return "-"
+            if isinstance(value, float):
+                return f"{value:.1f}"
+            return str(value)[:28] if column == 'name' else str(value)
+
+        columns = self.STOCK_COLUMNS + (self.SCORE_COLUMNS if 'value_score' in stock_data[0] else [])
+        lines = ["Current stock data available:", "|".join(label for _, label in columns)]
+        used = self.estimate_tokens("\n".join(lines))
+        for stock in stock_data[:self.max_stocks]:
+            line = "|".join(cell(stock, column) for column, _ in columns)
+            tokens = self.estimate_tokens(line)
+            if used + tokens > budget:
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join(lines) + "\n\n" if len(lines) > 2 else ""
+
+    def summarize_turn(self, msg: Dict) -> str:
+        """One line per folded turn: the question and the answer's opening sentence"""
+        answer = re.split(r'(?<=[.!?])\s+', msg['assistant'].strip(), maxsplit=1)[0]
+        return f"- User asked: {self.truncate(msg['user'], 25)} / Answer: {self.truncate(answer, 35)}"
+
+    def fold_into_summary(self, history: List[Dict], upto: int):
+        for msg in history[self.summarized_count:upto]:
+            line = self.summarize_turn(msg)
+            self.summary_lines.append(line)
+            self.summary_tokens += self.estimate_tokens(line)
+            # Oldest summary lines go first when the summary outgrows its budget
+            while self.summary_tokens > self.summary_budget and len(self.summary_lines) > 1:
+                self.summary_tokens -= self.estimate_tokens(self.summary_lines.pop(0))
+        self.summarized_count = max(self.summarized_count, upto)
+
+    def build(self, user_message: str, history: List[Dict], stock_data: List[Dict] = None) -> str:
+        start = time.perf_counter()
+        if len(history) < len(self.rendered_turns):
+            self.reset()  # history was cleared or replaced
+
+        # Render only turns we have not seen before
+        for msg in history[len(self.rendered_turns):]:
+            text = (f"User: {self.truncate(msg['user'], self.max_turn_tokens // 2)}\n"
+                    f"Assistant: {self.truncate(msg['assistant'], self.max_turn_tokens)}\n\n")
+            self.rendered_turns.append((text, self.estimate_tokens(text)))
+
+        message = f"Current user message: {self.truncate(user_message, self.max_message_tokens)}\n\n"
+        fixed = self.prefix_tokens + self.estimate_tokens(message) + self.estimate_tokens(self.CLOSING)
+        remaining = self.token_budget - fixed - self.summary_budget
+
+        stocks_text = self.render_stocks(stock_data, remaining // 3)
+        remaining -= self.estimate_tokens(stocks_text) if stocks_text else 0
+
+        # Walk back from the newest turn while verbatim turns still fit; the newest
+        # always stays verbatim (it is bounded by max_turn_tokens) so follow-ups keep context
+        window_start = len(history)
+        used = 0
+        while window_start > self.summarized_count:
+            tokens = self.rendered_turns[window_start - 1][1]
+            if used + tokens > remaining and window_start < len(history):
+                break
+            used += tokens
+            window_start -= 1
+        if window_start > self.summarized_count:
+            self.fold_into_summary(history, window_start)
+
+        parts = [self.prefix]
+        if self.summary_lines:
+            parts.append("Summary of earlier conversation:\n" + "\n".join(self.summary_lines) + "\n\n")
+        if window_start < len(history):
+            parts.append("Previous conversation:\n")
+            parts.extend(text for text, _ in self.rendered_turns[window_start:])
+        parts.extend([stocks_text, message, self.CLOSING])
+        prompt = "".join(parts)
+
+        self.last_stats = {
+            'prompt_tokens': self.estimate_tokens(prompt),
+            'prompt_chars': len(prompt),
+            'build_ms': (time.perf_counter() - start) * 1000,
+            'turns_verbatim': len(history) - window_start,
+            'turns_summarized': self.summarized_count,
+        }
+        return prompt
+
+class ChatSession:
+    """
+    Per-conversation state, so one screener can serve many users
+    """
+    def __init__(self, system_prompt: str, token_budget: int = 3000, session_id: Optional[str] = None):
+        self.session_id = session_id
+        self.conversation_history = []  # Full conversation context
+        self.current_stocks_context = []  # Current stocks being discussed
+        self.prompt_builder = ContextPromptBuilder(system_prompt, token_budget=token_budget)
+        self.last_active = time.time()
+
+    def clear(self):
+        self.conversation_history = []
+        self.current_stocks_context = []
+        self.prompt_builder.reset()
+
 class NLPStockScreener: # defining the class for Natural Language Stock Screener 
-    def __init__(self, api_key: str, db_path: str):
+    def __init__(self, api_key: str, db_path: str, use_columnar_engine: bool = False,
+                 result_cache_size: int = 128, client: Any = None,
+                 response_cache_path: Optional[str] = "llm_cache.db", response_cache_ttl: float = 24 * 3600,
+                 simulate_typing: bool = False, db_workers: int = 4, prompt_token_budget: int = 3000,
+                 llm_workers: int = 8, metrics_log: Optional[str] = None):
         """
         Initialize the ChatGPT-like Stock Screener
+
+        `client` can be any object exposing `models.generate_content_stream`, e.g. a
+        fake for offline tests. A relative `response_cache_path` is placed next
+        to the database, not in the working directory; set it to None to disable
+        the on-disk LLM response cache. Per-stage latency spans are kept in
+        `self.metrics` and appended to `metrics_log` as JSON lines when given.
         """
-        self.client = genai.Client(api_key=api_key)
+        self.client = client or genai.Client(api_key=api_key)
         self.model_name = "gemini-2.5-flash"
         self.db_path = db_path
-        self.conversation_history = []  # Full conversation context
-        self.current_stocks_context = []  # Current stocks being discussed
+        # Optional in-memory engine that answers screens without touching SQLite
+        self.engine = ColumnarScreenEngine(db_path) if use_columnar_engine else None
+        # Companies named in a message ("compare Infosys and TCS") are looked up directly
+        self.resolver = EntityResolver(db_path)
+
+        # LRU cache of screen results keyed on (sql, params, db version)
+        self.result_cache = OrderedDict()
+        self.result_cache_size = result_cache_size
+        self.result_cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cached_db_version = None
+        # Dedicated connection for PRAGMA data_version, which bumps whenever
+        # another connection (the scraper) commits to the database
+        self.version_conn = sqlite3.connect(db_path, check_same_thread=False)
+
+        if response_cache_path and not Path(response_cache_path).is_absolute():
+            response_cache_path = str(Path(db_path).resolve().parent / response_cache_path)
+        self.response_cache = (ResponseCache(response_cache_path, response_cache_ttl)
+                               if response_cache_path else None)
+
+        self.simulate_typing_enabled = simulate_typing  # cosmetic word-by-word output
+        self.response_metrics = deque(maxlen=500)  # ttft / total latency per response
+        # db_query / prompt_build / llm_call / llm_first_token / llm_stream / turn histograms
+        self.metrics = LatencyRecorder(metrics_log)
+
+        # Runtime owned for the screener's lifetime instead of per message
+        self.loop = None  # created on first process_message call
+        self.executor = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="screener-db")
+        self.pool = ReadConnectionPool(db_path, size=db_workers)
+        # Blocking SDK streams run here when driven from async code (server mode)
+        self.llm_executor = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="screener-llm")
         
         # System prompt that defines the AI's behavior  and what typr of output we want from it  
         self.system_prompt = """ 
@@ -35,6 +897,7 @@ Your personality:
 Database Schema Available:
 - stocks table with: symbol, name, sector, industry, market_cap, pe_ratio, pb_ratio, 
   roe, debt_to_equity, current_ratio, revenue_growth, net_profit_margin, dividend_yield, price, volume
+- ValuePct / GrowthPct / QualityPct: sector percentile scores (0-100, 100 = best in its sector)
 
 You can help with:
 - Stock screening and recommendations
@@ -45,181 +908,450 @@ You can help with:
 
 Always provide specific, data-backed reasoning for your recommendations.
 """
+        self.prompt_token_budget = prompt_token_budget
+        self.prompt_metrics = deque(maxlen=500)  # size and build time per prompt
+        self.session = self.new_session()  # the interactive CLI conversation
+
+    def new_session(self, session_id: Optional[str] = None) -> ChatSession:
+        """
+        Create isolated conversation state that shares this screener's DB and LLM client
+        """
+        return ChatSession(self.system_prompt, self.prompt_token_budget, session_id)
+
+    # The default session's state, kept as attributes for single-user callers
+    @property
+    def conversation_history(self) -> List[Dict]:
+        return self.session.conversation_history
+
+    @conversation_history.setter
+    def conversation_history(self, value: List[Dict]):
+        self.session.conversation_history = value
+
+    @property
+    def current_stocks_context(self) -> List[Dict]:
+        return self.session.current_stocks_context
+
+    @current_stocks_context.setter
+    def current_stocks_context(self, value: List[Dict]):
+        self.session.current_stocks_context = value
+
+    @property
+    def prompt_builder(self) -> ContextPromptBuilder:
+        return self.session.prompt_builder
 
     def get_db_connection(self): # connecting the db sql which we have created 
         """Create database connection"""
         return sqlite3.connect(self.db_path)
 
+    def get_db_version(self) -> int:
+        """
+        Token that changes whenever the database has been written to
+        """
+        with self.result_cache_lock:
+            return self.version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_cached_result(self, key) -> Optional[List[Dict]]:
+        """
+        Look up a screen result, dropping everything if the database changed
+        """
+        with self.result_cache_lock:
+            version = key[-1]
+            if version != self.cached_db_version:
+                self.result_cache.clear()  # the scraper wrote new data
+                self.cached_db_version = version
+
+            if key in self.result_cache:
+                self.result_cache.move_to_end(key)
+                self.cache_hits += 1
+                return self.result_cache[key]
+            self.cache_misses += 1
+            return None
+
+    def store_cached_result(self, key, results: List[Dict]):
+        with self.result_cache_lock:
+            if key[-1] != self.cached_db_version:
+                return  # computed against data that is already stale
+            self.result_cache[key] = results
+            self.result_cache.move_to_end(key)
+            while len(self.result_cache) > self.result_cache_size:
+                self.result_cache.popitem(last=False)
+
     async def get_stock_data_async(self, criteria: str) -> List[Dict]: 
         """
         Asynchronously fetch stock data based on criteria
         """
         def fetch_data(): # fetching the data from the db  
+            # Smart SQL generation based on criteria; the compiled query is the cache key
+            screen = parse_criteria(criteria)
+            sql_query, params = compile_criteria(screen)
+            key = (sql_query, params, self.get_db_version())
+            cached = self.get_cached_result(key)
+            if cached is not None:
+                return list(cached)
+
+            if self.engine:
+                try:
+                    results = self.engine.screen(screen)
+                    self.store_cached_result(key, results)
+                    return list(results)
+                except Exception as e:
+                    # The engine only accelerates screens; SQLite still has the answer
+                    print(f"Columnar engine error, falling back to SQL: {e}")
+
             try:
-                conn = self.get_db_connection()
-                cursor = conn.cursor()
-                
-                # Smart SQL generation based on criteria
-                sql_query = self.generate_smart_sql(criteria)
-                cursor.execute(sql_query)
-                
-                columns = [description[0] for description in cursor.description]
-                results = []
-                for row in cursor.fetchall():
-                    results.append(dict(zip(columns, row))) # using zip to save the data one by one in result 
-                
-                conn.close()
-                return results # return result  
+                with self.pool.connection() as conn:
+                    cursor = conn.execute(sql_query, params)
+                    columns = [description[0] for description in cursor.description]
+                    results = []
+                    for row in cursor.fetchall():
+                        results.append(dict(zip(columns, row))) # using zip to save the data one by one in result 
+
+                self.store_cached_result(key, results)
+                return list(results) # return result  
             except Exception as e:
                 print(f"Database error: {e}")
                 return []
         
-        # Run database query in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
-            return await loop.run_in_executor(executor, fetch_data)
+        # Run database query on the shared thread pool to avoid blocking
+        with self.metrics.span('db_query'):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fetch_data)
 
-    def generate_smart_sql(self, criteria: str) -> str: # sql which is used bt gemeni api to get the required data  
+    async def get_mentioned_stocks_async(self, message: str) -> List[Dict]:
         """
-        Generate SQL based on common criteria patterns
+        Rows for every company named in the message, in order of mention
         """
-        criteria = criteria.lower() # whatever criteria user tells will be lower abd saved in criteria
-        
-        if any(word in criteria for word in ['value', 'cheap', 'undervalued']): # fg vale,cheap,undervalued will be this sql query used
-            return "SELECT * FROM stocks WHERE pe_ratio < 15 AND pb_ratio < 2 AND roe > 10 ORDER BY pe_ratio ASC LIMIT 15"
-        
-        elif any(word in criteria for word in ['growth', 'growing', 'high growth']):# for growth , growing , high growing this 
-            return "SELECT * FROM stocks WHERE revenue_growth > 15 AND roe > 20 ORDER BY revenue_growth DESC LIMIT 15"
-        
-        elif any(word in criteria for word in ['dividend', 'income', 'yield']): # same
-            return "SELECT * FROM stocks WHERE dividend_yield > 2 ORDER BY dividend_yield DESC LIMIT 15"
-        
-        elif any(word in criteria for word in ['safe', 'stable', 'low risk']): #same
-            return "SELECT * FROM stocks WHERE debt_to_equity < 0.5 AND current_ratio > 1.5 AND roe > 10 ORDER BY debt_to_equity ASC LIMIT 15"
-        
-        elif any(word in criteria for word in ['large cap', 'big', 'large']):#same
-            return "SELECT * FROM stocks WHERE market_cap > 50000 ORDER BY market_cap DESC LIMIT 15"
-        
-        else: # this is default one if any criteria not match still it will find good stocks 
-            return "SELECT * FROM stocks WHERE roe > 15 AND pe_ratio < 30 AND debt_to_equity < 1 ORDER BY roe DESC LIMIT 15"
+        def fetch_mentioned():
+            try:
+                stock_ids = self.resolver.resolve(message)
+                if not stock_ids:
+                    return []
+                with self.pool.connection() as conn:
+                    cursor = conn.execute(
+                        f"SELECT * FROM stocks WHERE id IN ({', '.join('?' * len(stock_ids))})", stock_ids)
+                    columns = [description[0] for description in cursor.description]
+                    rows = {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+            except Exception as e:
+                print(f"Database error: {e}")
+                return []
+            return [rows[stock_id] for stock_id in stock_ids if stock_id in rows]
+
+        with self.metrics.span('entity_lookup'):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fetch_mentioned)
 
-    def create_context_prompt(self, user_message: str, stock_data: List[Dict] = None) -> str: # creating the prompt 
+    def generate_smart_sql(self, criteria: str) -> Tuple[str, Tuple]: # sql which is used bt gemeni api to get the required data  
         """
-        Create a comprehensive prompt with context
+        Parse the criteria and compile it into parameterized SQL
         """
-        prompt = f"{self.system_prompt}\n\n" # the prompt which we have declared previously is saved in this prompt var 
-        
-        # Add conversation history we add the previous conversiation to prompt for better context for api 
-        if self.conversation_history:  
-            prompt += "Previous conversation:\n"
-            for msg in self.conversation_history[-6:]:  # Last 6 messages for context
-                prompt += f"User: {msg['user']}\nAssistant: {msg['assistant']}\n\n"
-        
-        # Add current stock data if available but if it found new stocks related to the prompt it will show case them 
-        if stock_data:
-            prompt += "Current stock data available:\n"
-            for stock in stock_data[:10]:  # Limit to prevent prompt overflow
-                prompt += f"• {stock.get('name', 'N/A')} ({stock.get('symbol', 'N/A')}): "
-                prompt += f"PE={stock.get('pe_ratio', 'N/A')}, ROE={stock.get('roe', 'N/A')}%, "
-                prompt += f"Sector={stock.get('sector', 'N/A')}\n"
-            prompt += "\n"
-        
-        prompt += f"Current user message: {user_message}\n\n" 
-        # if user send normal message like hi , hello, etc so reply naturaly
-        prompt += "Respond naturally and conversationally. Use the stock data to provide specific recommendations when relevant."
-        
+        return compile_criteria(parse_criteria(criteria))
+
+    # One phrase per branch of generate_smart_sql, used to check query plans
+    SCREEN_PROBES = ['value', 'growth', 'dividend', 'safe', 'large cap', 'good stocks',
+                     'best stocks', 'cheapest banking stocks in their sector']
+
+    def verify_screen_plans(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Run EXPLAIN QUERY PLAN on every screen and check it is an index walk
+        """
+        report = {}
+        conn = self.get_db_connection()
+        try:
+            for probe in self.SCREEN_PROBES:
+                sql_query, params = self.generate_smart_sql(probe)
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql_query}", params)]
+                uses_index = any(INDEX_STEP_RE.search(step) for step in plan)
+                # "SCAN x USING [COVERING] INDEX" is an index walk; a bare SCAN reads the whole table
+                full_scan = any(step.startswith('SCAN ') and not INDEX_STEP_RE.search(step) for step in plan)
+                sorts = any('TEMP B-TREE' in step for step in plan)
+                report[probe] = {
+                    'sql': sql_query,
+                    'params': params,
+                    'plan': plan,
+                    'ok': uses_index and not full_scan and not sorts
+                }
+        finally:
+            conn.close()
+        return report
+
+    def create_context_prompt(self, user_message: str, stock_data: List[Dict] = None,
+                              session: Optional[ChatSession] = None) -> str: # creating the prompt 
+        """
+        Create a token-budgeted prompt with conversation and stock context
+        """
+        session = session or self.session
+        prompt = session.prompt_builder.build(user_message, session.conversation_history, stock_data)
+        stats = session.prompt_builder.last_stats
+        self.prompt_metrics.append(stats)
+        self.metrics.record('prompt_build', stats['build_ms'] / 1000, tokens=stats['prompt_tokens'])
         return prompt 
 
-    def stream_response(self, prompt: str) -> Generator[str, None, str]: # adding the live chatgpt like text generation using python time 
+    def generation_config(self):
+        """
+        Generation settings shared by every request (and part of the cache key)
+        """
+        return types.GenerateContentConfig(
+            temperature=0.7,  # More conversational
+            thinking_config=types.ThinkingConfig(thinking_budget=0)
+        )
+
+    @staticmethod
+    def simulate_typing(text: str) -> Generator[str, None, None]:
+        """
+        Cosmetic word-by-word re-emission with natural pauses (opt-in only)
+        """
+        for token in re.findall(r'\S+\s*|\s+', text):
+            yield token
+            time.sleep(0.05)  # Adjust speed here.  speed of word per nano second 
+            # Pause at end of sentences
+            if token.rstrip().endswith(('.', '!', '?')):
+                time.sleep(0.2) # the 0.2 second pause at the end of sentences
+
+    def stream_response(self, prompt: str, use_cache: bool = True, simulate_typing: Optional[bool] = None,
+                        raise_errors: bool = False) -> Generator[str, None, str]: # live chatgpt like text generation
         """
         Generate streaming response from LLM
+
+        Chunks are yielded as the model produces them. Identical prompts are
+        answered from the response cache unless `use_cache` is False. Model
+        errors become an apology message unless `raise_errors` is set. Timing
+        for each call is recorded in `self.response_metrics`, and as llm_call
+        (request sent until the model's first chunk arrives), llm_first_token
+        (including the cache lookup) and llm_stream (full completion) spans in
+        `self.metrics`; cache hits go to llm_cached.
         """
+        if simulate_typing is None:
+            simulate_typing = self.simulate_typing_enabled
+        start = time.perf_counter()
+        metrics = {'ttft': None, 'total': None, 'cached': False, 'chars': 0}
+        parts = []
+
         try:
-            # Note: Google's Gemini doesn't support true streaming yet
-            # This simulates streaming by chunking the response
-            response = self.client.models.generate_content(
+            config = self.generation_config()
+            cache_key = None
+            if self.response_cache and use_cache:
+                cache_key = ResponseCache.make_key(self.model_name, config, prompt)
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    metrics['cached'] = True
+                    parts.append(cached)
+                    metrics['ttft'] = time.perf_counter() - start
+                    yield from (self.simulate_typing(cached) if simulate_typing else [cached])
+                    return cached
+
+            # The SDK returns a lazy iterator, so the request is only complete once
+            # the first chunk arrives; timing the call itself would measure nothing
+            call_start = time.perf_counter()
+            stream = self.client.models.generate_content_stream(
                 model=self.model_name,
                 contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.7,  # More conversational
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)
-                )
+                config=config
             )
-            
-            full_response = response.text # all the response will be in response variable 
-            
-            # Simulate streaming with natural pauses 
-            sentences = re.split(r'(?<=[.!?])\s+', full_response)
-            
-            for sentence in sentences:
-                words = sentence.split()
-                for i, word in enumerate(words):
-                    yield word + (" " if i < len(words) - 1 else "")
-                    time.sleep(0.05)  # Adjust speed here.  speed of word per nano second 
-                
-                # Pause at end of sentences
-                if sentence.strip().endswith(('.', '!', '?')):
-                    yield " "
-                    time.sleep(0.2) # the 0.2 second pause at the end of sentences
-            
+            first_chunk = True
+            try:
+                for chunk in stream:
+                    if first_chunk:
+                        self.metrics.record('llm_call', time.perf_counter() - call_start)
+                        first_chunk = False
+                    text = chunk.text
+                    if not text:
+                        continue
+                    if metrics['ttft'] is None:
+                        metrics['ttft'] = time.perf_counter() - start # time to first token
+                    parts.append(text)
+                    if simulate_typing:
+                        yield from self.simulate_typing(text)
+                    else:
+                        yield text
+            finally:
+                # Closing this generator early (a dropped client) must end the SDK stream too
+                close = getattr(stream, 'close', None)
+                if close:
+                    close()
+
+            full_response = "".join(parts) # all the response will be in full_response variable 
+            if cache_key and full_response:
+                self.response_cache.put(cache_key, full_response)
             return full_response # returning full response  
             
         except Exception as e: 
+            if raise_errors:
+                raise
             yield f"I apologize, but I encountered an error: {e}"
             return f"Error: {e}"
+        finally:
+            metrics['total'] = time.perf_counter() - start
+            metrics['chars'] = sum(len(part) for part in parts)
+            self.response_metrics.append(metrics)
+            if metrics['cached']:
+                self.metrics.record('llm_cached', metrics['total'])
+            else:
+                if metrics['ttft'] is not None:
+                    self.metrics.record('llm_first_token', metrics['ttft'])
+                self.metrics.record('llm_stream', metrics['total'], chars=metrics['chars'])
+
+    async def stream_response_async(self, prompt: str, use_cache: bool = True,
+                                    raise_errors: bool = False) -> AsyncGenerator[str, None]:
+        """
+        Async view of stream_response; the blocking SDK stream runs on the LLM executor
+
+        If the consumer stops early (cancelled, client gone, `aclose()`), the pump
+        is told to stop pulling from the model and this generator only finishes
+        once the pump thread has exited, so callers holding a concurrency slot
+        release it after the executor worker is actually free.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
 
-    async def process_message_async(self, user_message: str) -> str: # Process user message asynchronously with context awareness . 
-        # Determine if we need stock data
-        needs_stock_data = any(keyword in user_message.lower() for keyword in [  # the users message will be checked that if it has certain keyword. 
+        def pump():
+            responses = self.stream_response(prompt, use_cache, simulate_typing=False, raise_errors=raise_errors)
+            try:
+                for chunk in responses:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                responses.close()
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+        future = loop.run_in_executor(self.llm_executor, pump)
+        finished = False
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is done:
+                    break
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                stop.set()
+                await asyncio.wait([future])  # the pump's own error, if any, is moot now
+        await future
+
+    @staticmethod
+    def needs_stock_data(user_message: str) -> bool:
+        # the users message will be checked that if it has certain keyword. 
+        return any(keyword in user_message.lower() for keyword in [
             'find', 'show', 'recommend', 'suggest', 'good', 'best', 'stocks', # keywords to check 
             'companies', 'investment', 'buy', 'portfolio'
         ])
-        
-        stock_data = [] # declaring a list 
-        if needs_stock_data: # if needs stocks data has any keyword than it will be sent to the get_stock_data_async 
+
+    async def prepare_turn(self, user_message: str, session: ChatSession) -> Tuple[List[Dict], str]:
+        """
+        Look up stock data if the message needs it and build the prompt
+        """
+        session.last_active = time.time()
+        # Named companies come first, then screen results for "find/show ..." requests
+        stock_data = await self.get_mentioned_stocks_async(user_message)
+        if self.needs_stock_data(user_message): # if needs stocks data has any keyword than it will be sent to the get_stock_data_async 
+            mentioned = {stock['symbol'] for stock in stock_data}
+            screened = await self.get_stock_data_async(user_message) # calling the function get stock data with the users message 
+            stock_data += [stock for stock in screened if stock['symbol'] not in mentioned]
+        if stock_data:
+            session.current_stocks_context = stock_data # saving the context for future 
+
+        # Create context-aware prompt for better cross question 
+        prompt = self.create_context_prompt(user_message, stock_data, session)
+        return stock_data, prompt
+
+    def record_turn(self, session: ChatSession, user_message: str, full_response: str, stock_data: List[Dict]):
+        # Store conversation 
+        session.conversation_history.append({
+            'user': user_message,  # users message in tuple within a dict 
+            'assistant': full_response,
+            'stocks_context': len(stock_data)
+        })
+        session.last_active = time.time()
+
+    async def process_message_async(self, user_message: str, use_cache: bool = True) -> str: # Process user message asynchronously with context awareness . 
+        with self.metrics.span('turn'):
+            return await self._process_message_async(user_message, use_cache)
+
+    async def _process_message_async(self, user_message: str, use_cache: bool) -> str:
+        if self.needs_stock_data(user_message):
             print("🔍 Searching database...", end="", flush=True) 
-            stock_data = await self.get_stock_data_async(user_message) # calling the function get stock data with the users message 
+        stock_data, prompt = await self.prepare_turn(user_message, self.session)
+        if self.needs_stock_data(user_message):
             print(f" Found {len(stock_data)} stocks")
-            self.current_stocks_context = stock_data # saving the context for future 
-        
-        # Create context-aware prompt for better cross question 
-        prompt = self.create_context_prompt(user_message, stock_data) 
+        elif stock_data:
+            print(f"🔍 Looked up {', '.join(stock['symbol'] for stock in stock_data)}")
         
         print("\n💡 AI Assistant: ", end="", flush=True)
         
         # Stream the response
         full_response = ""
-        for chunk in self.stream_response(prompt): #calling the self.stream_response  with prompt 
+        for chunk in self.stream_response(prompt, use_cache): #calling the self.stream_response  with prompt 
             print(chunk, end="", flush=True) # printing the response 
             full_response += chunk # saving the response in full_resopnse
         
         print("\n")
         
-        # Store conversation 
-        self.conversation_history.append({
-            'user': user_message,  # users message in tuple within a dict 
-            'assistant': full_response,
-            'stocks_context': len(stock_data)
-        })
-        
+        self.record_turn(self.session, user_message, full_response, stock_data)
         return full_response
 
-    def process_message(self, user_message: str) -> str: #Synchronous wrapper for message processing
-        return asyncio.run(self.process_message_async(user_message)) # asyncio.run is used to run async method process_message_async
+    def process_message(self, user_message: str, use_cache: bool = True) -> str: #Synchronous wrapper for message processing
+        # One event loop for the screener's lifetime rather than asyncio.run per message
+        if self.loop is None or self.loop.is_closed():
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(self.process_message_async(user_message, use_cache))
+
+    def profile_message(self, user_message: str, output: Optional[str] = None) -> str:
+        """
+        Process one message under cProfile (uncached, so the LLM path is included)
+        """
+        return profile_call(self.process_message, user_message, False, output=output)
+
+    def close(self):
+        """
+        Release the event loop, thread pool and database connections
+        """
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+        self.executor.shutdown(wait=True)
+        self.llm_executor.shutdown(wait=True)
+        self.pool.close()
+        self.version_conn.close()
+        self.resolver.close()
+        if self.engine:
+            self.engine.close()
+        if self.response_cache:
+            self.response_cache.close()
+        self.metrics.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     def get_conversation_stats(self) -> Dict: # Get conversation statistics 
-  
+        last = self.response_metrics[-1] if self.response_metrics else {}
+        last_prompt = self.prompt_metrics[-1] if self.prompt_metrics else {}
+        latency = self.metrics.summary()
         return { # returns a dict with key to it  
             'total_messages': len(self.conversation_history),
             'stocks_analyzed': len(self.current_stocks_context),
-            'last_query_time': time.time()
+            'last_query_time': time.time(),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_size': len(self.result_cache),
+            'response_cache_hits': self.response_cache.hits if self.response_cache else 0,
+            'response_cache_misses': self.response_cache.misses if self.response_cache else 0,
+            'last_ttft': last.get('ttft'),
+            'last_latency': last.get('total'),
+            'avg_db_query_ms': latency.get('db_query', {}).get('mean_ms'),
+            'last_prompt_tokens': last_prompt.get('prompt_tokens'),
+            'last_prompt_build_ms': last_prompt.get('build_ms'),
+            'turns_summarized': last_prompt.get('turns_summarized', 0),
+            'latency': latency
         }
 
     def clear_context(self):
         # Clear conversation context for next time 
     
-        self.conversation_history = [] 
-        self.current_stocks_context = []
+        self.session.clear()
         print("✅ Conversation context cleared")
 
     def show_current_stocks(self):
@@ -244,13 +1376,15 @@ def main():
     # Configuration
     API_KEY = "" # enter your API key here make sure it is of gemini which is right now free 
     DB_PATH = "" # the database path which we have saved by running the sql scraper code 
+    METRICS_LOG = None # optional file to append per-stage latency spans to, as JSON lines
      
     # Initialize screener
-    screener = NLPStockScreener(API_KEY, DB_PATH) 
+    screener = NLPStockScreener(API_KEY, DB_PATH, metrics_log=METRICS_LOG) 
     
     print("🚀 Natural language Stock Screener")
     print("💬 I'm your AI stock advisor. Ask me anything about Indian stocks!")
-    print("📋 Commands: /clear (clear context), /stocks (show current stocks), /stats (show stats)")
+    print("📋 Commands: /clear (clear context), /stocks (show current stocks), /stats (show stats), "
+          "/profile <question> (profile one answer)")
     print("-" * 60) 
     
     while True:
@@ -278,6 +1412,23 @@ def main():
                 print(f"📈 Conversation Stats:")
                 print(f"  • Messages: {stats['total_messages']}")
                 print(f"  • Stocks in context: {stats['stocks_analyzed']}")
+                print(f"  • Screen cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses, "
+                      f"{stats['cache_size']} entries")
+                print(f"  • LLM cache: {stats['response_cache_hits']} hits, {stats['response_cache_misses']} misses")
+                if stats['last_latency'] is not None:
+                    ttft = stats['last_ttft'] or 0.0
+                    print(f"  • Last response: first token {ttft:.2f}s, total {stats['last_latency']:.2f}s")
+                if stats['avg_db_query_ms'] is not None:
+                    print(f"  • Avg DB lookup: {stats['avg_db_query_ms']:.2f}ms")
+                if stats['last_prompt_tokens'] is not None:
+                    print(f"  • Last prompt: ~{stats['last_prompt_tokens']} tokens, built in "
+                          f"{stats['last_prompt_build_ms']:.2f}ms ({stats['turns_summarized']} turns summarized)")
+                print("⏱️  Stage latency:")
+                print(screener.metrics.format_table())
+                continue
+
+            elif user_input.lower().startswith('/profile '):
+                screener.profile_message(user_input[len('/profile '):].strip())
                 continue
             
             # Process the message
@@ -290,5 +1441,7 @@ def main():
             print(f"\n❌ Error: {e}")
             print("Try rephrasing your question or use /clear to reset context")
 
+    screener.close()
+
 if __name__ == "__main__":
     main()
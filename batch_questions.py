@@ -0,0 +1,187 @@
+"""
+Non-interactive batch mode: answer many questions concurrently and stream
+the results to JSONL.
+
+Input is either a text file with one question per line (ids are line
+numbers) or JSONL with {"id": ..., "question": "..."} or, for a multi-turn
+conversation, {"id": ..., "messages": ["...", "..."]}. Every item gets its
+own session. Items already answered in the output file are skipped, so an
+interrupted run continues where it stopped.
+
+    python batch_questions.py questions.txt --out answers.jsonl --concurrency 16
+    python batch_questions.py questions.jsonl --out answers.jsonl --fake-llm --db synthetic.db
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from instrumentation import percentile
+from StockfinderGPT import NLPStockScreener
+
+def load_questions(path):
+    """[(id, [messages...]), ...] from a .txt or .jsonl question file"""
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if path.endswith(('.jsonl', '.json')):
+                record = json.loads(line)
+                messages = record.get('messages') or [record['question']]
+                items.append((str(record.get('id', line_no)), [str(m) for m in messages]))
+            else:
+                items.append((str(line_no), [line]))
+    return items
+
+def completed_ids(path):
+    """Ids with a successful result in an existing output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by the interruption (drop_partial_line removes it)
+            if record.get('ok'):
+                done.add(record['id'])
+    return done
+
+def drop_partial_line(path):
+    """Cut a trailing unterminated line (a write interrupted mid-record) so appends start clean"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position < end:
+            f.truncate(position)
+        return end - position
+
+async def answer_item(screener, item_id, messages, use_cache):
+    """Run one conversation; returns (answers, stock symbols per turn, ttft of the first turn)"""
+    session = screener.new_session(item_id)
+    answers, stocks, ttft = [], [], None
+    start = time.perf_counter()
+    for message in messages:
+        stock_data, prompt = await screener.prepare_turn(message, session)
+        parts = []
+        async for chunk in screener.stream_response_async(prompt, use_cache, raise_errors=True):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(chunk)
+        answer = "".join(parts)
+        screener.record_turn(session, message, answer, stock_data)
+        answers.append(answer)
+        stocks.append([stock['symbol'] for stock in stock_data])
+    return answers, stocks, ttft
+
+async def run_batch(screener, items, out_path, concurrency=8, max_retries=3, base_delay=1.0, max_delay=30.0,
+                    use_cache=True):
+    """Answer items with `concurrency` workers, appending one JSON line per item as it finishes"""
+    drop_partial_line(out_path)
+    done = completed_ids(out_path)
+    pending = [item for item in items if item[0] not in done]
+    queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    latencies, ttfts = [], []
+    counts = {'ok': 0, 'failed': 0, 'retries': 0}
+    start = time.perf_counter()
+
+    with open(out_path, 'a', encoding='utf-8') as out:
+        async def worker():
+            while True:
+                try:
+                    item_id, messages = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = {'id': item_id, 'messages': messages}
+                item_start = time.perf_counter()
+                for attempt in range(max_retries):
+                    attempt_start = time.perf_counter()
+                    try:
+                        answers, stocks, ttft = await answer_item(screener, item_id, messages, use_cache)
+                    except Exception as e:
+                        record['error'] = f"{type(e).__name__}: {e}"
+                        if attempt < max_retries - 1:
+                            counts['retries'] += 1
+                            # Full jitter keeps retrying workers from moving in lockstep
+                            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * (2 ** attempt))))
+                        continue
+                    latency = time.perf_counter() - attempt_start
+                    record.update(ok=True, answers=answers, stocks=stocks, latency_s=latency, ttft_s=ttft)
+                    record.pop('error', None)
+                    latencies.append(latency)
+                    if ttft is not None:
+                        ttfts.append(ttft)
+                    break
+                else:
+                    record['ok'] = False
+                record['attempts'] = attempt + 1
+                record['elapsed_s'] = time.perf_counter() - item_start
+                counts['ok' if record['ok'] else 'failed'] += 1
+                out.write(json.dumps(record) + "\n")
+                out.flush()  # every finished item survives an interruption
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(pending))))))
+
+    elapsed = time.perf_counter() - start
+    return {
+        'items': len(items),
+        'skipped_done': len(items) - len(pending),
+        'ok': counts['ok'],
+        'failed': counts['failed'],
+        'retries': counts['retries'],
+        'elapsed_s': elapsed,
+        'items_per_s': counts['ok'] / elapsed if elapsed else 0.0,
+        'latency_s': {p: percentile(latencies, p) for p in (50, 95, 99)},
+        'ttft_s': {p: percentile(ttfts, p) for p in (50, 95, 99)},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions concurrently, writing JSONL")
+    parser.add_argument("questions", help="Text file (one question per line) or JSONL with id/question/messages")
+    parser.add_argument("--out", default="answers.jsonl", help="Results file; existing successful ids are skipped")
+    parser.add_argument("--db", default="stocks.db")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY", ""))
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversations in flight at once")
+    parser.add_argument("--retries", type=int, default=3, help="Attempts per item")
+    parser.add_argument("--base-delay", type=float, default=1.0, help="First retry backoff in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache")
+    parser.add_argument("--response-cache", default="llm_cache.db",
+                        help="LLM response cache file, relative to the database directory")
+    parser.add_argument("--columnar", action="store_true", help="Use the in-memory columnar screening engine")
+    parser.add_argument("--metrics-log", help="Append per-stage latency spans to this JSON-lines file")
+    parser.add_argument("--fake-llm", action="store_true", help="Answer with a local stub model (no API key needed)")
+    args = parser.parse_args()
+
+    client = None
+    if args.fake_llm:
+        from fake_backends import FakeGeminiClient
+        client = FakeGeminiClient()
+
+    items = load_questions(args.questions)
+    with NLPStockScreener(args.api_key, args.db, client=client, use_columnar_engine=args.columnar,
+                          llm_workers=args.concurrency, response_cache_path=args.response_cache,
+                          metrics_log=args.metrics_log) as screener:
+        summary = asyncio.run(run_batch(screener, items, args.out, args.concurrency, args.retries,
+                                        args.base_delay, use_cache=not args.no_cache))
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Offline benchmark suite for the scraper and the chat pipeline.
+
+Everything runs against synthetic data and the fake yfinance / Gemini backends
+in fake_backends.py, so results are repeatable without network access or API
+keys. Results are written as JSON so runs can be diffed for regressions.
+
+    python benchmark.py run --sizes 100,1000,10000 --out bench.json
+    python benchmark.py generate --symbols 100000 --db synthetic.db
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from Stock_scraper import StockDataScraper
+from StockfinderGPT import NLPStockScreener, ContextPromptBuilder
+from instrumentation import percentile
+from fake_backends import FakeGeminiClient, FakeTickerFactory, build_synthetic_db, synthetic_stock_rows
+
+SCREEN_QUERIES = [
+    "show best value stocks", "find growth stocks", "dividend stocks with ROE over 20",
+    "safe low risk stocks", "large cap stocks", "good stocks to buy", "low PE banking stocks",
+    "top 5 pharma stocks with debt to equity below 0.5",
+]
+
+def summarize(samples_seconds):
+    """Latency summary in milliseconds"""
+    ms = [s * 1000 for s in samples_seconds]
+    return {
+        'n': len(ms),
+        'mean_ms': sum(ms) / len(ms) if ms else None,
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+    }
+
+def bench_scrape(workdir, symbols, workers, latency):
+    """Scrape throughput through the real fetch/parse/save path with a fake ticker"""
+    results = {}
+    for worker_count in sorted({1, workers}):
+        db_path = os.path.join(workdir, f"scrape_{symbols}_{worker_count}.db")
+        factory = FakeTickerFactory(latency=latency)
+        scraper = StockDataScraper(db_path, ticker_factory=factory)
+        universe = [f"SYN{i:06d}.NS" for i in range(symbols)]
+        start = time.perf_counter()
+        success, failed = scraper.scrape_concurrent(universe, workers=worker_count, rate=None)
+        elapsed = time.perf_counter() - start
+        results[f"workers_{worker_count}"] = {
+            'symbols': symbols,
+            'success': success,
+            'failed': failed,
+            'seconds': elapsed,
+            'symbols_per_s': symbols / elapsed if elapsed else None,
+        }
+    return results
+
+def bench_db_write(workdir, rows):
+    """Per-row connect/commit versus the buffered WAL writer"""
+    data = synthetic_stock_rows(rows, seed=7)
+    per_row_count = min(rows, 2000)  # the per-row path is slow; sample it
+
+    scraper = StockDataScraper(os.path.join(workdir, f"write_row_{rows}.db"))
+    start = time.perf_counter()
+    for row in data[:per_row_count]:
+        scraper.save_to_database(row)
+    per_row = time.perf_counter() - start
+
+    scraper = StockDataScraper(os.path.join(workdir, f"write_bulk_{rows}.db"))
+    start = time.perf_counter()
+    scraper.save_many(data, batch_size=500)
+    bulk = time.perf_counter() - start
+
+    return {
+        'per_row': {'rows': per_row_count, 'seconds': per_row, 'rows_per_s': per_row_count / per_row},
+        'bulk': {'rows': rows, 'seconds': bulk, 'rows_per_s': rows / bulk},
+    }
+
+def bench_screens(db_path, repeats):
+    """Screen latency for the SQL path and the columnar engine, result cache disabled"""
+    results = {}
+    for label, columnar in (('sql', False), ('columnar', True)):
+        screener = NLPStockScreener("", db_path, client=FakeGeminiClient(), use_columnar_engine=columnar,
+                                    result_cache_size=0, response_cache_path=None)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(screener.get_stock_data_async(SCREEN_QUERIES[0]))  # warm up / load
+            samples = []
+            for _ in range(repeats):
+                for query in SCREEN_QUERIES:
+                    start = time.perf_counter()
+                    loop.run_until_complete(screener.get_stock_data_async(query))
+                    samples.append(time.perf_counter() - start)
+            results[label] = summarize(samples)
+        finally:
+            loop.close()
+            screener.close()
+    return results
+
+def bench_prompt_build(turns, answer_words=250):
+    """Prompt build time and size as the conversation grows"""
+    screener_prompt = "You are an expert financial advisor. " * 20
+    builder = ContextPromptBuilder(screener_prompt)
+    stocks = synthetic_stock_rows(15, seed=3)
+    history = []
+    samples = []
+    sizes = []
+    for i in range(turns):
+        start = time.perf_counter()
+        builder.build(f"question {i} about value stocks", history, stocks)
+        samples.append(time.perf_counter() - start)
+        sizes.append(builder.last_stats['prompt_tokens'])
+        history.append({'user': f"question {i} about value stocks",
+                        'assistant': f"Answer {i}. " + "analysis " * answer_words, 'stocks_context': 15})
+    result = summarize(samples)
+    result.update({'turns': turns, 'max_prompt_tokens': max(sizes), 'final_prompt_tokens': sizes[-1]})
+    return result
+
+def bench_end_to_end(db_path, messages, llm_ttft, llm_chunk_delay):
+    """Full turn: lookup, prompt build and streamed fake LLM answer"""
+    client = FakeGeminiClient(ttft=llm_ttft, chunk_delay=llm_chunk_delay)
+    screener = NLPStockScreener("", db_path, client=client, response_cache_path=None)
+
+    async def run():
+        latencies, ttfts = [], []
+        session = screener.new_session("bench")
+        for i in range(messages):
+            message = SCREEN_QUERIES[i % len(SCREEN_QUERIES)]
+            start = time.perf_counter()
+            first = None
+            stock_data, prompt = await screener.prepare_turn(message, session)
+            parts = []
+            async for chunk in screener.stream_response_async(prompt):
+                if first is None:
+                    first = time.perf_counter() - start
+                parts.append(chunk)
+            screener.record_turn(session, message, "".join(parts), stock_data)
+            latencies.append(time.perf_counter() - start)
+            ttfts.append(first)
+        return latencies, ttfts
+
+    try:
+        latencies, ttfts = asyncio.run(run())
+    finally:
+        screener.close()
+    return {'latency': summarize(latencies), 'ttft': summarize(ttfts),
+            'llm_ttft_s': llm_ttft, 'llm_chunk_delay_s': llm_chunk_delay}
+
+def run_benchmarks(args):
+    workdir = tempfile.mkdtemp(prefix="stockfinder-bench-")
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'sizes': args.sizes,
+        },
+        'benchmarks': []
+    }
+
+    def record(name, params, metrics):
+        results['benchmarks'].append({'name': name, 'params': params, 'metrics': metrics})
+        print(f"✓ {name} {json.dumps(params)}", flush=True)
+
+    try:
+        for size in args.sizes:
+            db_path = os.path.join(workdir, f"synthetic_{size}.db")
+            build_synthetic_db(db_path, size)
+
+            if 'scrape' in args.only:
+                scrape_size = min(size, args.max_scrape_symbols)
+                record('scrape_throughput', {'symbols': scrape_size, 'workers': args.workers,
+                                             'fetch_latency_s': args.fetch_latency},
+                       bench_scrape(workdir, scrape_size, args.workers, args.fetch_latency))
+            if 'write' in args.only:
+                record('db_write', {'rows': size}, bench_db_write(workdir, size))
+            if 'screen' in args.only:
+                record('screen_latency', {'symbols': size, 'repeats': args.repeats},
+                       bench_screens(db_path, args.repeats))
+            if 'e2e' in args.only:
+                record('end_to_end', {'symbols': size, 'messages': args.messages},
+                       bench_end_to_end(db_path, args.messages, args.llm_ttft, args.llm_chunk_delay))
+
+        if 'prompt' in args.only:
+            record('prompt_build', {'turns': args.turns}, bench_prompt_build(args.turns))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for StockfinderGPT")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the benchmark suite")
+    run.add_argument("--sizes", default="100,1000,10000",
+                     type=lambda value: [int(v) for v in value.split(',')], help="Comma-separated symbol counts")
+    run.add_argument("--only", default="scrape,write,screen,prompt,e2e",
+                     type=lambda value: set(value.split(',')), help="Subset of benchmarks to run")
+    run.add_argument("--out", help="Write JSON results to this file (default: stdout)")
+    run.add_argument("--workers", type=int, default=16)
+    run.add_argument("--fetch-latency", type=float, default=0.02, help="Fake yfinance latency per symbol")
+    run.add_argument("--max-scrape-symbols", type=int, default=1000)
+    run.add_argument("--repeats", type=int, default=20, help="Passes over the screen queries")
+    run.add_argument("--turns", type=int, default=40, help="Conversation length for prompt builds")
+    run.add_argument("--messages", type=int, default=20, help="End-to-end messages per size")
+    run.add_argument("--llm-ttft", type=float, default=0.05)
+    run.add_argument("--llm-chunk-delay", type=float, default=0.005)
+
+    gen = sub.add_parser("generate", help="Write a synthetic stocks database")
+    gen.add_argument("--symbols", type=int, default=10000)
+    gen.add_argument("--db", default="synthetic_stocks.db")
+    gen.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # the scraper logs every flush at INFO
+
+    if args.command == "generate":
+        stats = build_synthetic_db(args.db, args.symbols, args.seed)
+        print(json.dumps({'db': args.db, 'symbols': args.symbols, **stats}, indent=2))
+        return
+
+    results = run_benchmarks(args)
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+        print(f"📄 Results written to {args.out}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Columnar export of the stocks database and an analytics API over it.
+
+`export_database` streams the current snapshot (with sector scores) and the
+dated history out of SQLite into hive-partitioned Parquet or Arrow IPC files:
+
+    export/snapshot/sector=Technology/part-0.parquet
+    export/history/year=2026/part-0.parquet
+
+`ColumnarAnalytics` reads those files memory-mapped, only the columns a
+report needs, with partition pruning. Aggregates are computed in Arrow, so
+only the small result tables become pandas objects.
+
+    python columnar_export.py export --db stocks.db --out export
+    python columnar_export.py report --out export
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:  # export and analytics are optional
+    pa = None
+
+from Stock_scraper import HISTORY_COLUMNS, SCORE_COLUMNS, STOCK_COLUMNS
+
+FORMATS = {'parquet': 'parquet', 'arrow': 'ipc'}
+MANIFEST = "_export.json"
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for columnar export (pip install pyarrow)")
+
+def _field(column):
+    if column in ('symbol', 'name', 'sector', 'industry', 'last_updated'):
+        return pa.field(column, pa.string())
+    if column == 'volume':
+        return pa.field(column, pa.int64())
+    return pa.field(column, pa.float64())
+
+def snapshot_schema():
+    _require_pyarrow()
+    return pa.schema([_field(col) for col in STOCK_COLUMNS + ['last_updated'] + SCORE_COLUMNS])
+
+def history_schema():
+    _require_pyarrow()
+    return pa.schema([pa.field('symbol', pa.string()), pa.field('snapshot_date', pa.int32())]
+                     + [_field(col) for col in HISTORY_COLUMNS] + [pa.field('year', pa.int32())])
+
+def _record_batches(cursor, schema, batch_size):
+    """Turn a cursor into Arrow record batches without materializing every row"""
+    names = schema.names
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(columns[i], type=schema.field(name).type) for i, name in enumerate(names)], schema=schema)
+
+def _write_partitioned(batches, schema, target, partition, fmt):
+    """Write into a staging directory, then swap it in so readers never see half an export"""
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    ds.write_dataset(batches, staging, schema=schema, format=FORMATS[fmt],
+                     partitioning=[partition], partitioning_flavor='hive',
+                     basename_template="part-{i}." + ('parquet' if fmt == 'parquet' else 'arrow'))
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.replace(staging, target)
+
+def export_database(db_path, out_dir, fmt='parquet', batch_size=50_000, history=True):
+    """
+    Export the snapshot (partitioned by sector) and history (by year); returns row counts
+    """
+    _require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    start = time.perf_counter()
+
+    # write_dataset pulls batches from its own thread; they are still read one at a time
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'stock_scores' in tables:
+            scores = ', '.join(f"sc.{col}" for col in SCORE_COLUMNS)
+            join = "LEFT JOIN stock_scores sc ON sc.stock_id = s.id"
+        else:
+            scores = ', '.join(f"NULL AS {col}" for col in SCORE_COLUMNS)
+            join = ""
+        # Hive partitions need a value, so companies without a sector get their own
+        columns = ', '.join("COALESCE(NULLIF(s.sector, ''), 'Unknown')" if col == 'sector' else f"s.{col}"
+                            for col in STOCK_COLUMNS)
+        cursor = conn.execute(f"""
+            SELECT {columns},
+                   s.last_updated, {scores}
+            FROM stocks s {join} ORDER BY s.sector, s.symbol
+        """)
+        schema = snapshot_schema()
+        counts['snapshot'] = conn.execute("SELECT COUNT(*) FROM stocks").fetchone()[0]
+        _write_partitioned(_record_batches(cursor, schema, batch_size), schema,
+                           os.path.join(out_dir, "snapshot"), 'sector', fmt)
+
+        if history and 'stock_history' in tables:
+            cursor = conn.execute(f"""
+                SELECT symbol, snapshot_date, {', '.join(HISTORY_COLUMNS)}, snapshot_date / 10000 AS year
+                FROM stock_history ORDER BY snapshot_date, symbol
+            """)
+            schema = history_schema()
+            counts['history'] = conn.execute("SELECT COUNT(*) FROM stock_history").fetchone()[0]
+            _write_partitioned(_record_batches(cursor, schema, batch_size), schema,
+                               os.path.join(out_dir, "history"), 'year', fmt)
+    finally:
+        conn.close()
+
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump({'format': fmt, 'db_path': os.path.abspath(db_path), 'rows': counts,
+                   'exported_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   'seconds': time.perf_counter() - start}, f, indent=2)
+    return counts
+
+class ColumnarAnalytics:
+    """
+    Summary and aggregate reports over an export, read memory-mapped with column projection
+    """
+    def __init__(self, export_dir):
+        _require_pyarrow()
+        with open(os.path.join(export_dir, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.export_dir = export_dir
+        self.format = FORMATS[self.manifest['format']]
+        self.filesystem = pafs.LocalFileSystem(use_mmap=True)
+        self.datasets = {}
+
+    def dataset(self, name):
+        if name not in self.datasets:
+            path = os.path.join(self.export_dir, name)
+            if not os.path.isdir(path):
+                raise FileNotFoundError(f"No {name} export in {self.export_dir}")
+            self.datasets[name] = ds.dataset(path, format=self.format, partitioning='hive',
+                                             filesystem=self.filesystem)
+        return self.datasets[name]
+
+    def scan(self, name, columns=None, filter=None):
+        """Arrow table of only `columns`; sector / year filters prune whole partitions"""
+        return self.dataset(name).to_table(columns=columns, filter=filter)
+
+    def summary(self, sample_size=5):
+        """Stock count, sector distribution and a sample, like StockDataScraper.get_stock_summary"""
+        sectors = (self.scan('snapshot', ['sector'])
+                   .group_by('sector').aggregate([('sector', 'count')])
+                   .rename_columns(['sector', 'count']).sort_by('sector'))
+        sample = self.scan('snapshot', ['symbol', 'name', 'sector', 'pe_ratio', 'roe', 'debt_to_equity'],
+                           filter=pc.is_valid(pc.field('pe_ratio'))).slice(0, sample_size)
+        return {
+            'total_stocks': pc.sum(sectors['count']).as_py() or 0,
+            'sectors': sectors.to_pandas(),
+            'sample': sample.to_pandas(),
+        }
+
+    def sector_report(self, metrics=('pe_ratio', 'pb_ratio', 'roe', 'debt_to_equity', 'dividend_yield'),
+                      sectors=None):
+        """Per-sector count, mean and approximate median of each metric"""
+        filter = pc.field('sector').isin(list(sectors)) if sectors else None
+        table = self.scan('snapshot', ['sector'] + list(metrics), filter=filter)
+        aggregations = [('sector', 'count')]
+        for metric in metrics:
+            aggregations += [(metric, 'mean'), (metric, 'approximate_median')]
+        return table.group_by('sector').aggregate(aggregations).sort_by('sector').to_pandas()
+
+    def top(self, metric, n=10, sector=None, descending=True, columns=('symbol', 'name', 'sector')):
+        """The n best rows by one metric, optionally within one sector partition"""
+        filter = pc.is_valid(pc.field(metric))
+        if sector:
+            filter &= pc.field('sector') == sector
+        table = self.scan('snapshot', list(dict.fromkeys(list(columns) + [metric])), filter=filter)
+        if n <= 0 or table.num_rows == 0:
+            return table.slice(0, 0).to_pandas()  # empty, but with the usual columns
+        order = 'descending' if descending else 'ascending'
+        indices = pc.select_k_unstable(table, k=min(n, table.num_rows), sort_keys=[(metric, order)])
+        return table.take(indices).sort_by([(metric, order)]).to_pandas()
+
+    def history_report(self, metrics=('pe_ratio', 'roe', 'price'), start=None, end=None, symbols=None):
+        """Market-wide daily aggregates over the dated history"""
+        filter = None
+        if start is not None:
+            filter = (pc.field('year') >= start // 10000) & (pc.field('snapshot_date') >= start)
+        if end is not None:
+            upper = (pc.field('year') <= end // 10000) & (pc.field('snapshot_date') <= end)
+            filter = upper if filter is None else filter & upper
+        if symbols:
+            by_symbol = pc.field('symbol').isin(list(symbols))
+            filter = by_symbol if filter is None else filter & by_symbol
+        table = self.scan('history', ['snapshot_date', 'symbol'] + list(metrics), filter=filter)
+        aggregations = [('symbol', 'count_distinct')]
+        for metric in metrics:
+            aggregations += [(metric, 'mean'), (metric, 'approximate_median')]
+        return table.group_by('snapshot_date').aggregate(aggregations).sort_by('snapshot_date').to_pandas()
+
+def print_summary(analytics):
+    summary = analytics.summary()
+    print(f"\n📊 Database Summary:")
+    print(f"Total stocks: {summary['total_stocks']}")
+    print(f"\nSector distribution:")
+    print(summary['sectors'].to_string(index=False))
+    print(f"\nSample data:")
+    print(summary['sample'].to_string(index=False))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the stocks database to Parquet/Arrow and report on it")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Write the snapshot and history as partitioned files")
+    export.add_argument("--db", default="stocks.db")
+    export.add_argument("--out", default="export")
+    export.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    export.add_argument("--no-history", action="store_true")
+
+    report = sub.add_parser("report", help="Summary and sector report from an export")
+    report.add_argument("--out", default="export")
+    report.add_argument("--top", metavar="METRIC", help="Also list the top 10 stocks by this metric")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        counts = export_database(args.db, args.out, args.format, history=not args.no_history)
+        print(f"📦 Exported {json.dumps(counts)} to {args.out}")
+        return
+
+    analytics = ColumnarAnalytics(args.out)
+    print_summary(analytics)
+    print(f"\nSector report:")
+    print(analytics.sector_report().to_string(index=False))
+    if args.top:
+        print(f"\nTop 10 by {args.top}:")
+        print(analytics.top(args.top).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Offline stand-ins for Gemini and yfinance plus a synthetic stocks database, so
+the server, load test and benchmarks can run without network access or API keys.
+"""
+import hashlib
+import random
+import threading
+import time
+
+import pandas as pd
+
+from Stock_scraper import StockDataScraper
+
+SECTORS = [
+    'Financial Services', 'Technology', 'Healthcare', 'Consumer Defensive', 'Consumer Cyclical',
+    'Energy', 'Basic Materials', 'Utilities', 'Communication Services', 'Industrials', 'Real Estate'
+]
+
+FILLER_WORDS = (
+    "Based on the current data these companies show solid fundamentals with healthy return on "
+    "equity and reasonable valuations relative to their sector peers so they could suit a long "
+    "term investor who is comfortable with moderate risk"
+).split()
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModels:
+    """Mimics `client.models` with configurable first-token and per-chunk latency"""
+    def __init__(self, ttft=0.2, chunk_delay=0.02, chunks=20, words_per_chunk=4, failure_rate=0.0, seed=0):
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.words_per_chunk = words_per_chunk
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.chunks_sent = 0  # lets callers check that an abandoned stream stopped early
+
+    def _start_call(self):
+        with self.lock:
+            self.calls += 1
+            failed = self.rng.random() < self.failure_rate
+        if failed:
+            time.sleep(self.ttft)
+            raise ConnectionError("simulated model overload (503)")
+
+    def _chunks(self, contents):
+        # Deterministic per prompt so cached and uncached answers are comparable
+        seed = int(hashlib.md5(str(contents).encode('utf-8')).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        for _ in range(self.chunks):
+            words = [rng.choice(FILLER_WORDS) for _ in range(self.words_per_chunk)]
+            yield " ".join(words) + " "
+
+    def generate_content_stream(self, model, contents, config=None):
+        self._start_call()
+        time.sleep(self.ttft)
+        for i, text in enumerate(self._chunks(contents)):
+            if i:
+                time.sleep(self.chunk_delay)
+            with self.lock:
+                self.chunks_sent += 1
+            yield FakeChunk(text)
+
+    def generate_content(self, model, contents, config=None):
+        self._start_call()
+        time.sleep(self.ttft + self.chunk_delay * (self.chunks - 1))
+        return FakeChunk("".join(self._chunks(contents)))
+
+class FakeGeminiClient:
+    """Drop-in for `genai.Client` as used by NLPStockScreener"""
+    def __init__(self, ttft=0.2, chunk_delay=0.02, chunks=20, words_per_chunk=4, failure_rate=0.0, seed=0):
+        self.models = FakeModels(ttft, chunk_delay, chunks, words_per_chunk, failure_rate, seed)
+
+class FakeTicker:
+    """Mimics `yf.Ticker(symbol)`; reading `.info` costs `latency` seconds"""
+    def __init__(self, symbol, latency=0.05, failure_rate=0.0, rng=None):
+        self.symbol = symbol
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random(symbol)
+
+    @property
+    def info(self):
+        time.sleep(self.latency)
+        if self.rng.random() < self.failure_rate:
+            raise ConnectionError(f"simulated network failure for {self.symbol}")
+        index = int(hashlib.md5(self.symbol.encode('utf-8')).hexdigest()[:8], 16)
+        row = synthetic_stock_rows(1, seed=index)[0]
+        # Ratios come back as fractions, the way yfinance reports them
+        return {
+            'longName': f"{self.symbol.split('.')[0].title()} Limited",
+            'sector': row['sector'],
+            'industry': row['industry'],
+            'marketCap': row['market_cap'],
+            'trailingPE': row['pe_ratio'],
+            'priceToBook': row['pb_ratio'],
+            'returnOnEquity': row['roe'] / 100 if row['roe'] is not None else None,
+            'debtToEquity': row['debt_to_equity'],
+            'currentRatio': row['current_ratio'],
+            'revenueGrowth': row['revenue_growth'] / 100 if row['revenue_growth'] is not None else None,
+            'profitMargins': row['net_profit_margin'] / 100 if row['net_profit_margin'] is not None else None,
+            'dividendYield': row['dividend_yield'] / 100 if row['dividend_yield'] is not None else None,
+            'currentPrice': row['price'],
+            'volume': row['volume'],
+        }
+
+class FakeTickerFactory:
+    """Pass as `StockDataScraper(ticker_factory=...)` to scrape without the network"""
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, symbol):
+        with self.lock:
+            self.calls += 1
+            rng = random.Random(self.rng.random())
+        return FakeTicker(symbol, self.latency, self.failure_rate, rng)
+
+class FakeDownloader:
+    """Mimics `yf.download(tickers, group_by='ticker')`; each call costs `latency` seconds"""
+    def __init__(self, latency=0.2, days=5, missing_rate=0.0, seed=0):
+        self.latency = latency
+        self.days = days
+        self.missing_rate = missing_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def __call__(self, tickers, period="5d", interval="1d", group_by="ticker", **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=self.days, freq="B")
+        frames = {}
+        for symbol in tickers:
+            if self.rng.random() < self.missing_rate:
+                continue  # delisted or unknown ticker: yfinance just leaves it out
+            base = self.rng.uniform(10, 5000)
+            frames[symbol] = pd.DataFrame({
+                'Open': [base * self.rng.uniform(0.98, 1.02) for _ in index],
+                'Close': [base * self.rng.uniform(0.98, 1.02) for _ in index],
+                'Volume': [self.rng.randint(1000, 10_000_000) for _ in index],
+            }, index=index)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1)
+
+def synthetic_stock_rows(count, seed=0):
+    """Plausible-looking fundamentals for `count` fake symbols"""
+    rng = random.Random(seed)
+
+    def maybe(value, missing=0.05):
+        return None if rng.random() < missing else value
+
+    rows = []
+    for i in range(count):
+        rows.append({
+            'symbol': f"SYN{i:06d}.NS",
+            'name': f"Synthetic Company {i} Limited",
+            'sector': rng.choice(SECTORS),
+            'industry': f"Industry {rng.randint(1, 60)}",
+            'market_cap': maybe(10 ** rng.uniform(9, 13)),
+            'pe_ratio': maybe(rng.uniform(-20, 80)),
+            'pb_ratio': maybe(rng.uniform(0.2, 15)),
+            'roe': maybe(rng.uniform(-10, 45)),
+            'debt_to_equity': maybe(rng.uniform(0, 3)),
+            'current_ratio': maybe(rng.uniform(0.3, 4)),
+            'revenue_growth': maybe(rng.uniform(-20, 60)),
+            'net_profit_margin': maybe(rng.uniform(-15, 40)),
+            'dividend_yield': maybe(rng.uniform(0, 6), missing=0.3),
+            'price': rng.uniform(10, 5000),
+            'volume': rng.randint(1000, 10_000_000),
+        })
+    return rows
+
+def build_synthetic_db(db_path, count, seed=0):
+    """Create (or top up) a stocks database with `count` synthetic symbols"""
+    scraper = StockDataScraper(db_path)
+    return scraper.save_many(synthetic_stock_rows(count, seed), batch_size=1000)
@@ -0,0 +1,113 @@
+"""
+Lightweight latency instrumentation shared by the scraper and the chat pipeline.
+
+Stages are timed with `recorder.span("name")`. Samples are kept in bounded
+per-stage buffers and summarized as p50/p95/p99 histograms. They can
+optionally be written as JSON lines, and `profile_call` wraps any call in
+cProfile.
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted sequence (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class LatencyRecorder:
+    """
+    Thread-safe span recorder with per-stage latency histograms
+    """
+    def __init__(self, jsonl_path=None, max_samples=2048):
+        self.max_samples = max_samples
+        self.samples = {}  # stage -> deque of seconds
+        self.counts = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.jsonl = open(jsonl_path, 'a', buffering=1) if jsonl_path else None
+
+    def record(self, name, seconds, **attrs):
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.max_samples)
+                self.counts[name] = 0
+                self.totals[name] = 0.0
+            self.samples[name].append(seconds)
+            self.counts[name] += 1
+            self.totals[name] += seconds
+            if self.jsonl:
+                self.jsonl.write(json.dumps({'ts': time.time(), 'span': name, 'ms': seconds * 1000, **attrs}) + "\n")
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time the enclosed block as one sample of stage `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, **attrs)
+
+    def summary(self):
+        """Per-stage count, mean and p50/p95/p99/max in milliseconds"""
+        with self.lock:
+            snapshot = {name: (list(values), self.counts[name], self.totals[name])
+                        for name, values in self.samples.items()}
+        result = {}
+        for name, (values, count, total) in snapshot.items():
+            ms = [v * 1000 for v in values]
+            result[name] = {
+                'count': count,
+                'mean_ms': total * 1000 / count if count else None,
+                'p50_ms': percentile(ms, 50),
+                'p95_ms': percentile(ms, 95),
+                'p99_ms': percentile(ms, 99),
+                'max_ms': max(ms) if ms else None,
+            }
+        return result
+
+    def format_table(self):
+        """Human-readable summary for CLI output"""
+        summary = self.summary()
+        if not summary:
+            return "  (no spans recorded yet)"
+        lines = [f"  {'stage':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+        for name, stats in sorted(summary.items()):
+            lines.append(f"  {name:<18}{stats['count']:>7}{stats['p50_ms']:>10.2f}"
+                         f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+            self.totals.clear()
+
+    def close(self):
+        if self.jsonl:
+            self.jsonl.close()
+            self.jsonl = None
+
+def profile_call(func, *args, output=None, sort='cumulative', limit=25, **kwargs):
+    """
+    Run func under cProfile; dump stats to `output` (a .prof file) or print the top entries
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        if output:
+            profiler.dump_stats(output)
+            print(f"📄 Profile written to {output}")
+        else:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+            print(stream.getvalue())
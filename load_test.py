@@ -0,0 +1,137 @@
+"""
+Load test for stockfinder_server.py against a stub model.
+
+By default it starts an in-process server backed by FakeGeminiClient and a
+synthetic database, then drives many concurrent sessions through /chat and
+prints a JSON summary (throughput, latency and time-to-first-byte percentiles).
+Pass --url to target a server that is already running instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from urllib.parse import urlparse
+
+from instrumentation import percentile
+
+QUESTIONS = [
+    "Show me the best value stocks",
+    "Find dividend stocks with ROE over 15",
+    "Low PE banking stocks please",
+    "Which growth stocks look good?",
+    "Tell me more about the first one",
+    "Any safe large cap companies to buy?",
+]
+
+async def chat_request(host, port, session_id, message):
+    """POST /chat and read the chunked stream; returns (status, ttfb, total, bytes)"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps({'session_id': session_id, 'message': message, 'stream': True}).encode('utf-8')
+    writer.write((f"POST /chat HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    ttfb = None
+    received = 0
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).strip() or b'0', 16)
+            if size == 0:
+                break
+            await reader.readexactly(size + 2)  # chunk data plus CRLF
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            received += size
+    else:
+        received = len(await reader.read())
+    writer.close()
+    return status, ttfb, time.perf_counter() - start, received
+
+async def run_session(host, port, index, messages, results, think_time):
+    session_id = f"load-{index}"
+    rng = random.Random(index)
+    for _ in range(messages):
+        try:
+            results.append(await chat_request(host, port, session_id, rng.choice(QUESTIONS)))
+        except Exception:
+            results.append((None, None, None, 0))
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, think_time))
+
+async def run_load(host, port, sessions, messages, think_time):
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(host, port, i, messages, results, think_time) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r[0] == 200]
+    latencies = [r[2] for r in ok]
+    ttfbs = [r[1] for r in ok if r[1] is not None]
+    return {
+        'sessions': sessions,
+        'requests': len(results),
+        'ok': len(ok),
+        'rejected_503': sum(1 for r in results if r[0] == 503),
+        'failed': sum(1 for r in results if r[0] not in (200, 503)),
+        'elapsed_s': elapsed,
+        'requests_per_s': len(ok) / elapsed if elapsed else 0.0,
+        'latency_s': {p: percentile(latencies, p) for p in (50, 95, 99)},
+        'ttfb_s': {p: percentile(ttfbs, p) for p in (50, 95, 99)},
+    }
+
+async def main(args):
+    if args.url:
+        parsed = urlparse(args.url)
+        summary = await run_load(parsed.hostname, parsed.port or 80, args.sessions, args.messages, args.think_time)
+        print(json.dumps(summary, indent=2))
+        return
+
+    from fake_backends import FakeGeminiClient, build_synthetic_db
+    from StockfinderGPT import NLPStockScreener
+    from stockfinder_server import StockfinderServer
+
+    workdir = tempfile.mkdtemp(prefix="stockfinder-load-")
+    db_path = args.db or os.path.join(workdir, "stocks.db")
+    if not args.db:
+        build_synthetic_db(db_path, args.symbols)
+
+    client = FakeGeminiClient(ttft=args.ttft, chunk_delay=args.chunk_delay, chunks=args.chunks)
+    screener = NLPStockScreener("", db_path, client=client, response_cache_path=None,
+                                llm_workers=args.max_llm_calls)
+    server = await StockfinderServer(screener, "127.0.0.1", 0, args.max_llm_calls, args.max_queue).start()
+    try:
+        summary = await run_load("127.0.0.1", server.port, args.sessions, args.messages, args.think_time)
+        summary['server'] = server.get_stats()
+        summary['llm_calls'] = client.models.calls
+        print(json.dumps(summary, indent=2))
+    finally:
+        await server.close()
+        screener.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the stock screener server with a stub model")
+    parser.add_argument("--url", help="Target an already running server, e.g. http://127.0.0.1:8080")
+    parser.add_argument("--db", help="Existing stocks database (default: synthetic)")
+    parser.add_argument("--symbols", type=int, default=2000, help="Synthetic symbols when no --db is given")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=3, help="Messages per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between messages")
+    parser.add_argument("--max-llm-calls", type=int, default=16)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Stub model time to first chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    parser.add_argument("--chunks", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
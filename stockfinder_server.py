@@ -0,0 +1,297 @@
+"""
+Async multi-session HTTP server for the stock screener.
+
+One NLPStockScreener (one SQLite connection pool, one LLM client) is shared by
+every session; each session only carries its own conversation state.
+
+Endpoints:
+    POST   /chat              {"session_id": "...", "message": "...", "stream": true}
+    GET    /stats             server and screener statistics
+    DELETE /sessions/<id>     drop a session
+    GET    /health
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
+
+from StockfinderGPT import NLPStockScreener
+
+MAX_BODY_BYTES = 64 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+# Session ids are echoed in a response header, so only plain tokens are accepted
+SESSION_ID_RE = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+class RequestError(Exception):
+    """A request the server refuses before routing it; carries the HTTP status"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class SessionStore:
+    """
+    LRU store of chat sessions with idle expiry and a per-session turn lock
+    """
+    def __init__(self, screener, max_sessions=1000, idle_ttl=1800):
+        self.screener = screener
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sessions = OrderedDict()  # id -> (ChatSession, asyncio.Lock)
+        self.evicted = 0
+
+    def get(self, session_id):
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            entry = (self.screener.new_session(session_id), asyncio.Lock())
+            self.sessions[session_id] = entry
+            while len(self.sessions) > self.max_sessions:
+                oldest_id, (_, lock) = next(iter(self.sessions.items()))
+                if lock.locked():
+                    break  # never evict a session mid-turn
+                del self.sessions[oldest_id]
+                self.evicted += 1
+        self.sessions.move_to_end(session_id)
+        return entry
+
+    def drop(self, session_id):
+        return self.sessions.pop(session_id, None) is not None
+
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_ttl
+        stale = [sid for sid, (session, lock) in self.sessions.items()
+                 if session.last_active < cutoff and not lock.locked()]
+        for sid in stale:
+            del self.sessions[sid]
+        self.evicted += len(stale)
+        return len(stale)
+
+class StockfinderServer:
+    def __init__(self, screener, host="127.0.0.1", port=8080, max_llm_calls=8, max_queue=64,
+                 max_sessions=1000, idle_ttl=1800):
+        self.screener = screener
+        self.host = host
+        self.port = port
+        self.sessions = SessionStore(screener, max_sessions, idle_ttl)
+        self.max_llm_calls = max_llm_calls
+        self.max_queue = max_queue
+        self.llm_slots = asyncio.Semaphore(max_llm_calls)
+        self.pending = 0  # chat requests admitted and not yet finished
+        self.served = 0
+        self.rejected = 0
+        self.errors = 0
+        self.server = None
+        self.janitor = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # resolves port 0
+        self.janitor = asyncio.create_task(self.evict_loop())
+        return self
+
+    async def evict_loop(self):
+        while True:
+            await asyncio.sleep(60)
+            self.sessions.evict_idle()
+
+    async def close(self):
+        if self.janitor:
+            self.janitor.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    # --- HTTP plumbing -------------------------------------------------------
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        if not request_line:
+            return None
+        parts = request_line.split(' ')
+        if len(parts) != 3:
+            raise RequestError(400, 'malformed request line')
+        method, path, _ = parts
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise RequestError(400, 'invalid Content-Length') from None
+        if length < 0:
+            raise RequestError(400, 'invalid Content-Length')
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, 'request body too large')
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), path, headers, body
+
+    async def send_json(self, writer, status, payload, extra_headers=""):
+        body = json.dumps(payload).encode('utf-8')
+        writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                      f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                      f"{extra_headers}Connection: close\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                request = await self.read_request(reader)
+            except RequestError as e:
+                await self.send_json(writer, e.status, {'error': str(e)})
+                return
+            if request is None:
+                return
+            method, path, _, body = request
+
+            if method == 'POST' and path == '/chat':
+                await self.handle_chat(writer, body)
+            elif method == 'GET' and path == '/stats':
+                await self.send_json(writer, 200, self.get_stats())
+            elif method == 'GET' and path == '/health':
+                await self.send_json(writer, 200, {'status': 'ok'})
+            elif method == 'DELETE' and path.startswith('/sessions/'):
+                dropped = self.sessions.drop(path[len('/sessions/'):])
+                await self.send_json(writer, 200 if dropped else 404, {'dropped': dropped})
+            else:
+                await self.send_json(writer, 404, {'error': 'not found'})
+        except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.errors += 1
+            try:
+                await self.send_json(writer, 500, {'error': str(e)})
+            except Exception:
+                pass
+        finally:
+            writer.close()
+
+    # --- chat ------------------------------------------------------------------
+
+    async def handle_chat(self, writer, body):
+        try:
+            payload = json.loads(body or b'{}')
+            if not isinstance(payload, dict):
+                raise ValueError("body is not a JSON object")
+            message = str(payload['message']).strip()
+        except (ValueError, KeyError):
+            await self.send_json(writer, 400, {'error': 'expected JSON object with "message"'})
+            return
+        if not message:
+            await self.send_json(writer, 400, {'error': 'empty message'})
+            return
+        session_id = str(payload.get('session_id') or uuid.uuid4().hex)
+        if not SESSION_ID_RE.fullmatch(session_id):
+            await self.send_json(writer, 400, {'error': 'session_id must be 1-64 letters, digits, "-" or "_"'})
+            return
+        stream = payload.get('stream', True)
+        use_cache = payload.get('use_cache', True)
+
+        # Backpressure: shed load instead of queueing without bound
+        if self.pending >= self.max_llm_calls + self.max_queue:
+            self.rejected += 1
+            await self.send_json(writer, 503, {'error': 'server busy, retry shortly'}, "Retry-After: 1\r\n")
+            return
+
+        self.pending += 1
+        try:
+            session, turn_lock = self.sessions.get(session_id)
+            async with turn_lock:  # turns within one session stay ordered
+                with self.screener.metrics.span('turn'):
+                    stock_data, prompt = await self.screener.prepare_turn(message, session)
+                    async with self.llm_slots:
+                        if stream:
+                            full_response = await self.stream_chunked(writer, session_id, prompt, use_cache)
+                        else:
+                            async with aclosing(self.screener.stream_response_async(prompt, use_cache)) as chunks:
+                                parts = [chunk async for chunk in chunks]
+                            full_response = "".join(parts)
+                            await self.send_json(writer, 200, {
+                                'session_id': session_id,
+                                'response': full_response,
+                                'stocks': len(stock_data)
+                            })
+                    self.screener.record_turn(session, message, full_response, stock_data)
+                    self.served += 1
+        finally:
+            self.pending -= 1
+
+    async def stream_chunked(self, writer, session_id, prompt, use_cache):
+        writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                      f"X-Session-Id: {session_id}\r\nTransfer-Encoding: chunked\r\n"
+                      f"Connection: close\r\n\r\n").encode('latin-1'))
+        parts = []
+        # aclosing stops the model stream as soon as the client goes away, and only
+        # returns (releasing the caller's LLM slot) once the pump thread has exited
+        async with aclosing(self.screener.stream_response_async(prompt, use_cache)) as chunks:
+            async for chunk in chunks:
+                parts.append(chunk)
+                data = chunk.encode('utf-8')
+                writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return "".join(parts)
+
+    def get_stats(self):
+        stats = self.screener.get_conversation_stats()
+        for key in ('total_messages', 'stocks_analyzed', 'turns_summarized'):
+            stats.pop(key, None)  # those describe the CLI session, not the server
+        stats.update({
+            'sessions': len(self.sessions.sessions),
+            'sessions_evicted': self.sessions.evicted,
+            'pending': self.pending,
+            'served': self.served,
+            'rejected': self.rejected,
+            'errors': self.errors,
+        })
+        return stats
+
+async def serve(args, client=None):
+    screener = NLPStockScreener(args.api_key, args.db, client=client, use_columnar_engine=args.columnar,
+                                llm_workers=args.max_llm_calls, response_cache_path=args.response_cache or None,
+                                metrics_log=args.metrics_log)
+    server = await StockfinderServer(screener, args.host, args.port, args.max_llm_calls, args.max_queue,
+                                     args.max_sessions, args.idle_ttl).start()
+    print(f"🚀 Stock screener server listening on http://{server.host}:{server.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+        screener.close()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Multi-session stock screener server")
+    parser.add_argument("--db", default="stocks.db")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY", ""))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-llm-calls", type=int, default=8, help="Concurrent LLM calls")
+    parser.add_argument("--max-queue", type=int, default=64, help="Requests allowed to wait for an LLM slot")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--idle-ttl", type=float, default=1800, help="Seconds before an idle session is evicted")
+    parser.add_argument("--columnar", action="store_true", help="Use the in-memory columnar screening engine")
+    parser.add_argument("--response-cache", default="llm_cache.db",
+                        help="LLM response cache file, relative to the database directory ('' disables it)")
+    parser.add_argument("--metrics-log", help="Append per-stage latency spans to this JSON-lines file")
+    parser.add_argument("--fake-llm", action="store_true", help="Answer with a local stub model (no API key needed)")
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    client = None
+    if args.fake_llm:
+        from fake_backends import FakeGeminiClient
+        client = FakeGeminiClient()
+    try:
+        asyncio.run(serve(args, client))
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
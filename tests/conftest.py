@@ -0,0 +1,29 @@
+"""
+Shared fixtures; the modules under test live at the repository root.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_backends import FakeGeminiClient, build_synthetic_db  # noqa: E402
+from StockfinderGPT import NLPStockScreener  # noqa: E402
+
+@pytest.fixture(scope="session")
+def synthetic_db(tmp_path_factory):
+    """A small stocks database shared by the whole run; tests must not write to it"""
+    db_path = str(tmp_path_factory.mktemp("db") / "stocks.db")
+    build_synthetic_db(db_path, 300)
+    return db_path
+
+@pytest.fixture
+def fake_client():
+    return FakeGeminiClient(ttft=0.0, chunk_delay=0.0, chunks=5)
+
+@pytest.fixture
+def screener(synthetic_db, fake_client, tmp_path):
+    with NLPStockScreener("", synthetic_db, client=fake_client,
+                          response_cache_path=str(tmp_path / "llm_cache.db")) as screener:
+        yield screener
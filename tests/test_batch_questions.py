@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+from batch_questions import completed_ids, drop_partial_line, load_questions, run_batch
+from fake_backends import FakeGeminiClient
+from StockfinderGPT import NLPStockScreener
+
+def read_records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def run(synthetic_db, items, out_path, client=None, **kwargs):
+    client = client or FakeGeminiClient(ttft=0.0, chunk_delay=0.0, chunks=3)
+    with NLPStockScreener("", synthetic_db, client=client, response_cache_path=None) as screener:
+        return asyncio.run(run_batch(screener, items, out_path, concurrency=4, base_delay=0.0, **kwargs))
+
+def test_load_questions_text_and_jsonl(tmp_path):
+    text = tmp_path / "q.txt"
+    text.write_text("value stocks\n\n# comment\nbanks\n")
+    assert load_questions(str(text)) == [("1", ["value stocks"]), ("4", ["banks"])]
+    jsonl = tmp_path / "q.jsonl"
+    jsonl.write_text('{"id": "a", "question": "x"}\n{"id": "b", "messages": ["y", "z"]}\n')
+    assert load_questions(str(jsonl)) == [("a", ["x"]), ("b", ["y", "z"])]
+
+def test_resume_skips_answered_items(synthetic_db, tmp_path):
+    out = str(tmp_path / "answers.jsonl")
+    items = [(str(i), [f"top {i + 1} stocks"]) for i in range(6)]
+    first = run(synthetic_db, items[:3], out)
+    second = run(synthetic_db, items, out)
+    assert (first['ok'], second['ok'], second['skipped_done']) == (3, 3, 3)
+    assert sorted(record['id'] for record in read_records(out)) == [str(i) for i in range(6)]
+
+def test_resume_after_truncated_last_line(synthetic_db, tmp_path):
+    out = tmp_path / "answers.jsonl"
+    out.write_text('{"id": "0", "ok": true}\n{"id": "1", "ok": tr')  # crashed mid-write
+    items = [("0", ["value stocks"]), ("1", ["banks"]), ("2", ["growth stocks"])]
+    summary = run(synthetic_db, items, str(out))
+    records = read_records(out)  # every line parses
+    assert summary['skipped_done'] == 1
+    assert [record['id'] for record in records][0] == "0"
+    assert sorted(record['id'] for record in records[1:]) == ["1", "2"]
+    assert completed_ids(str(out)) == {"0", "1", "2"}
+
+def test_failed_items_are_retried_on_the_next_run(synthetic_db, tmp_path):
+    out = str(tmp_path / "answers.jsonl")
+    items = [("only", ["value stocks"])]
+    failing = FakeGeminiClient(ttft=0.0, chunk_delay=0.0, failure_rate=1.0)
+    summary = run(synthetic_db, items, out, client=failing, max_retries=2)
+    assert (summary['failed'], summary['retries']) == (1, 1)
+    assert completed_ids(out) == set()
+    assert run(synthetic_db, items, out)['ok'] == 1
+
+def test_drop_partial_line(tmp_path):
+    path = tmp_path / "r.jsonl"
+    for content, kept in [(b"", b""), (b"a\n", b"a\n"), (b"a\nb", b"a\n"), (b"b", b""),
+                          (b"x" * 5000 + b"\n" + b"y" * 5000, b"x" * 5000 + b"\n")]:
+        path.write_bytes(content)
+        assert drop_partial_line(str(path)) == len(content) - len(kept)
+        assert path.read_bytes() == kept
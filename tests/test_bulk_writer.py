@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+from fake_backends import synthetic_stock_rows
+from Stock_scraper import BulkStockWriter, StockDataScraper, refresh_scores
+
+def scores(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT stock_id, sector, composite_score FROM stock_scores ORDER BY stock_id").fetchall()
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize("defer_scores", [False, True])
+def test_scores_match_a_full_refresh(tmp_path, defer_scores):
+    db_path = str(tmp_path / "stocks.db")
+    StockDataScraper(db_path)  # creates the schema
+    with BulkStockWriter(db_path, batch_size=50, defer_scores=defer_scores) as writer:
+        for row in synthetic_stock_rows(300):
+            writer.add(row)
+        # moving a company to another sector must re-rank the one it left
+        writer.add(dict(synthetic_stock_rows(1)[0], sector='Moved'))
+    written = scores(db_path)
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        refresh_scores(conn)
+    conn.close()
+    assert written == scores(db_path)
+    assert len(written) == 300
+
+def test_deferred_scores_wait_for_close(tmp_path):
+    db_path = str(tmp_path / "stocks.db")
+    StockDataScraper(db_path)
+    writer = BulkStockWriter(db_path, batch_size=10, defer_scores=True)
+    for row in synthetic_stock_rows(20):
+        writer.add(row)
+    assert scores(db_path) == []
+    writer.close()
+    assert len(scores(db_path)) == 20
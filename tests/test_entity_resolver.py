@@ -0,0 +1,56 @@
+import pytest
+
+from fake_backends import FakeGeminiClient
+from Stock_scraper import StockDataScraper
+from StockfinderGPT import EntityResolver, NLPStockScreener
+
+COMPANIES = [
+    ('INFY.NS', 'Infosys Limited'), ('TCS.NS', 'Tata Consultancy Services Limited'),
+    ('IDEA.NS', 'Vodafone Idea Limited'), ('CASH.NS', 'Cash Systems Ltd'),
+    ('RAIN.NS', 'Rain Industries Limited'), ('HOME.NS', 'Home First Finance Company India Limited'),
+    ('TATAPOWER.NS', 'The Tata Power Company Limited'), ('FEDERALBNK.NS', 'The Federal Bank Limited'),
+]
+
+@pytest.fixture(scope="module")
+def resolver(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp("entities") / "stocks.db")
+    StockDataScraper(db_path).save_many([{'symbol': symbol, 'name': name, 'sector': 'Test'}
+                                         for symbol, name in COMPANIES])
+    resolver = EntityResolver(db_path)
+    yield resolver
+    resolver.close()
+
+def symbols(resolver, message):
+    ids = dict(resolver.conn.execute("SELECT id, symbol FROM stocks"))
+    return [ids[stock_id] for stock_id in resolver.resolve(message)]
+
+@pytest.mark.parametrize("message, expected", [
+    ("Compare Infosys and TCS", ['INFY.NS', 'TCS.NS']),
+    ("compare INFY with IDEA", ['INFY.NS', 'IDEA.NS']),
+    ("infy.ns vs idea.ns", ['INFY.NS', 'IDEA.NS']),
+    ("how is infosis doing", ['INFY.NS']),
+    ("tell me about tata power", ['TATAPOWER.NS']),
+    ("federal bank results", ['FEDERALBNK.NS']),
+])
+def test_mentions(resolver, message, expected):
+    assert symbols(resolver, message) == expected
+
+@pytest.mark.parametrize("message", [
+    "Is it a good idea to invest now?",
+    "strong cash flows",
+    "benefit from rain",
+    "home loan rates",
+    "hello",
+])
+def test_lowercase_words_are_not_symbols(resolver, message):
+    assert symbols(resolver, message) == []
+
+def test_database_without_stocks_table(tmp_path):
+    resolver = EntityResolver(str(tmp_path / "empty.db"))
+    assert resolver.resolve("compare INFY and TCS") == []
+    resolver.close()
+
+def test_non_stock_message_on_an_empty_database(tmp_path):
+    with NLPStockScreener("", str(tmp_path / "empty.db"), client=FakeGeminiClient(ttft=0.0, chunk_delay=0.0),
+                          response_cache_path=None) as screener:
+        assert screener.process_message("hello")
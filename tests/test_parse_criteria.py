@@ -0,0 +1,53 @@
+import pytest
+
+from StockfinderGPT import DEFAULT_SCREEN, compile_criteria, parse_criteria
+
+@pytest.mark.parametrize("message, limit", [
+    ("top 5 banks", 5),
+    ("show me the top 20 growth stocks", 20),
+    ("10 best dividend stocks", 10),
+    ("best 7 stocks in their sector", 7),
+    ("top 500 stocks", 100),  # clamped
+    ("show me 5 stocks", 5),
+    ("give me 3 banking stocks", 3),
+    ("list 10 pharma companies", 10),
+])
+def test_explicit_limit(message, limit):
+    assert parse_criteria(message).limit == limit
+
+@pytest.mark.parametrize("message", [
+    "debt below 1 stocks",
+    "pe under 12 stocks",
+    "I have 50000 shares",
+    "roe above 20 companies",
+])
+def test_numbers_that_are_not_limits(message):
+    assert parse_criteria(message).limit == DEFAULT_SCREEN['limit']
+
+def test_comparison_number_is_not_reused_as_limit():
+    criteria = parse_criteria("roe above 20 best 3")
+    assert ('roe', '>', 20.0) in criteria.filters
+    assert criteria.limit == 3
+
+def test_comparisons_and_sector():
+    criteria = parse_criteria("banks with pe under 12 and roe over 15%")
+    assert criteria.sector == 'Financial Services'
+    assert ('pe_ratio', '<', 12.0) in criteria.filters
+    assert ('roe', '>', 15.0) in criteria.filters
+
+def test_low_pe_excludes_losses():
+    criteria = parse_criteria("low pe tech stocks")
+    assert criteria.sort == 'pe_ratio' and not criteria.descending
+    assert ('pe_ratio', '>', 0) in criteria.filters
+
+def test_unrecognised_message_uses_default_screen():
+    criteria = parse_criteria("what should I buy?")
+    assert criteria.filters == DEFAULT_SCREEN['filters']
+    assert criteria.sort == DEFAULT_SCREEN['sort']
+
+def test_same_shape_compiles_to_same_sql():
+    sql_a, params_a = compile_criteria(parse_criteria("pe under 12"))
+    sql_b, params_b = compile_criteria(parse_criteria("pe under 20"))
+    assert sql_a == sql_b
+    assert params_a != params_b
+    assert '?' in sql_a and '12' not in sql_a
@@ -0,0 +1,30 @@
+from StockfinderGPT import ContextPromptBuilder
+
+def turn(i, size=200):
+    return {'user': f"question {i} " + "q" * size, 'assistant': f"Answer {i}. " + "a " * size}
+
+def test_long_message_is_truncated_to_the_budget():
+    builder = ContextPromptBuilder("You are a stock assistant.", token_budget=1500)
+    history = [turn(0)]
+    prompt = builder.build("x" * 20000, history)
+    assert builder.estimate_tokens(prompt) <= 1500
+    assert "question 0" in prompt.split("Summary of earlier conversation")[-1]
+    assert builder.summarized_count == 0
+
+def test_newest_turn_stays_verbatim_under_pressure():
+    builder = ContextPromptBuilder("You are a stock assistant.", token_budget=600, summary_budget=100)
+    history = []
+    for i in range(6):
+        prompt = builder.build("and what about banks?", history)
+        history.append(turn(i, size=600))
+    prompt = builder.build("and what about banks?", history)
+    assert "Previous conversation:\nUser: question 5" in prompt
+    assert builder.summarized_count == 5
+
+def test_turns_fold_into_summary_once():
+    builder = ContextPromptBuilder("You are a stock assistant.", token_budget=800)
+    history = [turn(i) for i in range(10)]
+    builder.build("next", history)
+    folded = builder.summarized_count
+    builder.build("next", history)
+    assert 0 < folded == builder.summarized_count < 10
@@ -0,0 +1,40 @@
+import os
+
+from fake_backends import FakeGeminiClient
+from StockfinderGPT import NLPStockScreener, ResponseCache
+
+def test_put_get_and_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl_seconds=60)
+    cache.put("k", "answer")
+    assert cache.get("k") == "answer"
+    cache.ttl_seconds = -1  # everything is now expired
+    assert cache.get("k") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=10)
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    assert cache.get("a") == "12345"  # a is now more recent than b
+    cache.put("c", "12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == "12345" and cache.get("c") == "12345"
+    cache.close()
+
+def test_cache_defaults_to_the_database_directory(synthetic_db, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with NLPStockScreener("", synthetic_db, client=FakeGeminiClient(ttft=0.0, chunk_delay=0.0)) as screener:
+        path = screener.response_cache.path
+    assert os.path.dirname(path) == os.path.dirname(os.path.abspath(synthetic_db))
+    assert not os.path.exists(tmp_path / "llm_cache.db")
+
+def test_identical_prompt_is_served_from_cache(screener, fake_client):
+    first = "".join(screener.stream_response("hello", simulate_typing=False))
+    calls = fake_client.models.calls
+    second = "".join(screener.stream_response("hello", simulate_typing=False))
+    assert first == second
+    assert fake_client.models.calls == calls
+    bypass = "".join(screener.stream_response("hello", use_cache=False, simulate_typing=False))
+    assert bypass == first
+    assert fake_client.models.calls == calls + 1
@@ -0,0 +1,53 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from fake_backends import FakeGeminiClient, build_synthetic_db
+from StockfinderGPT import NLPStockScreener
+
+@pytest.fixture
+def own_db(tmp_path):
+    db_path = str(tmp_path / "stocks.db")
+    build_synthetic_db(db_path, 100)
+    return db_path
+
+def screen(screener, message):
+    return asyncio.run(screener.get_stock_data_async(message))
+
+def test_repeated_screen_is_a_cache_hit(own_db):
+    with NLPStockScreener("", own_db, client=FakeGeminiClient(), response_cache_path=None) as screener:
+        first = screen(screener, "value stocks")
+        second = screen(screener, "value stocks")
+        assert first == second
+        assert (screener.cache_hits, screener.cache_misses) == (1, 1)
+
+def test_write_from_another_connection_invalidates(own_db):
+    with NLPStockScreener("", own_db, client=FakeGeminiClient(), response_cache_path=None) as screener:
+        before = screen(screener, "top 3 high roe stocks")
+        conn = sqlite3.connect(own_db)
+        with conn:
+            conn.execute("UPDATE stocks SET roe = 999 WHERE symbol = ?", (before[-1]['symbol'],))
+        conn.close()
+        after = screen(screener, "top 3 high roe stocks")
+        assert screener.cache_misses == 2
+        assert after[0]['symbol'] == before[-1]['symbol']
+        assert after[0]['roe'] == 999
+
+def test_result_cache_is_bounded(own_db):
+    with NLPStockScreener("", own_db, client=FakeGeminiClient(), response_cache_path=None,
+                          result_cache_size=2) as screener:
+        for limit in (1, 2, 3):
+            screen(screener, f"top {limit} stocks")
+        assert len(screener.result_cache) == 2
+
+def test_columnar_engine_failure_falls_back_to_sql(own_db, monkeypatch):
+    with NLPStockScreener("", own_db, client=FakeGeminiClient(), response_cache_path=None,
+                          use_columnar_engine=True) as screener:
+        expected = screen(screener, "value stocks")
+        screener.result_cache.clear()
+
+        def broken(criteria):
+            raise RuntimeError("engine snapshot unavailable")
+        monkeypatch.setattr(screener.engine, "screen", broken)
+        assert expected and screen(screener, "value stocks") == expected
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+
+from fake_backends import FakeGeminiClient
+from StockfinderGPT import NLPStockScreener
+from stockfinder_server import StockfinderServer
+
+async def exchange(port, raw):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+def chat_request(payload):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+    return b"POST /chat HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+
+def status_of(response):
+    return int(response.split(b" ", 2)[1])
+
+def run_with_server(synthetic_db, scenario, client=None, **server_args):
+    async def main():
+        with NLPStockScreener("", synthetic_db, client=client or FakeGeminiClient(ttft=0.0, chunk_delay=0.0, chunks=5),
+                              response_cache_path=None) as screener:
+            server = await StockfinderServer(screener, port=0, **server_args).start()
+            try:
+                return await scenario(server)
+            finally:
+                await server.close()
+    return asyncio.run(main())
+
+@pytest.mark.parametrize("raw, status", [
+    (b"GARBAGE\r\n\r\n", 400),
+    (b"POST /chat HTTP/1.1\r\nContent-Length: abc\r\n\r\n", 400),
+    (b"POST /chat HTTP/1.1\r\nContent-Length: -5\r\n\r\n", 400),
+    (b"POST /chat HTTP/1.1\r\nContent-Length: 999999\r\n\r\n", 413),
+    (chat_request(b"[]"), 400),
+    (chat_request(b'"x"'), 400),
+    (chat_request(b"{not json"), 400),
+    (chat_request({'message': '   '}), 400),
+    (b"GET /nope HTTP/1.1\r\n\r\n", 404),
+    (b"GET /health HTTP/1.1\r\n\r\n", 200),
+])
+def test_request_errors(synthetic_db, raw, status):
+    response = run_with_server(synthetic_db, lambda server: exchange(server.port, raw))
+    assert status_of(response) == status
+
+def test_session_id_cannot_inject_headers(synthetic_db):
+    payload = {'message': 'value stocks', 'session_id': "abc\r\nSet-Cookie: stolen=1"}
+    response = run_with_server(synthetic_db, lambda server: exchange(server.port, chat_request(payload)))
+    head = response.split(b"\r\n\r\n", 1)[0]
+    assert status_of(response) == 400
+    assert b"Set-Cookie" not in head
+
+def test_streamed_chat_echoes_session_id(synthetic_db):
+    payload = {'message': 'value stocks', 'session_id': 'alice-1'}
+    response = run_with_server(synthetic_db, lambda server: exchange(server.port, chat_request(payload)))
+    head, body = response.split(b"\r\n\r\n", 1)
+    assert status_of(response) == 200
+    assert b"X-Session-Id: alice-1\r\n" in head
+    assert body.endswith(b"0\r\n\r\n")
+
+def test_non_streamed_chat(synthetic_db):
+    payload = {'message': 'value stocks', 'stream': False}
+    response = run_with_server(synthetic_db, lambda server: exchange(server.port, chat_request(payload)))
+    result = json.loads(response.split(b"\r\n\r\n", 1)[1])
+    assert status_of(response) == 200
+    assert result['response'] and result['session_id']
+
+def test_disconnect_stops_the_model_stream(synthetic_db):
+    client = FakeGeminiClient(ttft=0.0, chunk_delay=0.05, chunks=40)
+
+    async def scenario(server):
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(chat_request({'message': 'tell me about markets', 'use_cache': False}))
+        await writer.drain()
+        await reader.read(200)  # headers and the first chunk
+        writer.transport.abort()
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if server.pending == 0:
+                break
+        return server
+
+    server = run_with_server(synthetic_db, scenario, client=client, max_llm_calls=1)
+    assert server.pending == 0
+    assert not server.llm_slots.locked()
+    assert client.models.chunks_sent < 40